@@ -1,49 +1,150 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
 from langgraph.graph import StateGraph, START, END
-from langgraph.types import Command
+from langgraph.types import CachePolicy, Command
+from langgraph.cache.memory import InMemoryCache
+from langgraph.checkpoint.memory import InMemorySaver
 from langchain.chat_models import init_chat_model
+from langchain.embeddings import init_embeddings
+from langchain_core.messages import AIMessageChunk, message_chunk_to_message, messages_from_dict, message_to_dict
 from email_assistant.schemas import State, RouterSchema
 from email_assistant.utils import parse_email, format_email_markdown
 from email_assistant.prompts import (TRIAGE_SYSTEM_PROMPT, DEFAULT_BACKGROUND, DEFAULT_TRIAGE_INSTRUCTIONS, TRIAGE_USER_PROMPT, AGENT_SYSTEM_PROMPT, DEFAULT_RESPONSE_PREFERENCES, DEFAULT_CAL_PREFERENCES)
 from dotenv import load_dotenv
 from email_assistant.agent_tools import TOOLS
+from email_assistant.tools.default.prompt_templates import AGENT_TOOLS_PROMPT
+from email_assistant.clients import http_client, http_async_client
+from email_assistant.fast_triage import fast_triage
+from email_assistant.llm_cache import LLMCache, LRUCache, SemanticCache, cache_key
 from IPython.display import Image, display
-from typing import Literal
+from types import MappingProxyType
+from typing import AsyncIterator, Literal, Optional
 
 
 # Load environment variables first
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Initialize LLM
-llm = init_chat_model("openai:gpt-4.1", temperature=0.0)
+LLM_MODEL = "openai:gpt-4.1"
+LLM_TEMPERATURE = 0.0
+# stream_usage keeps token usage on the final chunk when streaming
+llm = init_chat_model(
+    LLM_MODEL,
+    temperature=LLM_TEMPERATURE,
+    stream_usage=True,
+    http_client=http_client,
+    http_async_client=http_async_client,
+)
 
-# Create router llm with structured output
-llm_router = llm.with_structured_output(RouterSchema)
+# Create router llm with structured output. Triage is a 3-way classification,
+# so a smaller, faster model is enough; drafting keeps the full model.
+# Strict JSON schema decoding guarantees a parseable response on the first try.
+ROUTER_MODEL = "openai:gpt-4.1-mini"
+llm_router = init_chat_model(
+    ROUTER_MODEL,
+    temperature=LLM_TEMPERATURE,
+    http_client=http_client,
+    http_async_client=http_async_client,
+).with_structured_output(RouterSchema, method="json_schema", strict=True)
+
+# Create tool-enabled LLM for response generation.
+# OpenAI caches prompt prefixes automatically, which only pays off when the
+# prefix (tool schemas + system prompt) is byte-identical across calls: keep
+# tools in a fixed order and route all agent calls with one prompt_cache_key.
+PROMPT_CACHE_KEY = "email-agent-v1"
+AGENT_TOOLS = sorted(TOOLS, key=lambda tool: tool.name)
+tools_by_name = MappingProxyType({tool.name: tool for tool in AGENT_TOOLS})
+llm_with_tools = llm.bind_tools(AGENT_TOOLS, tool_choice="any", prompt_cache_key=PROMPT_CACHE_KEY)
+
+# Tool subsets per stage of the response; once the reply has been sent only
+# Done is useful, so later calls send a much smaller tool schema
+TOOL_SUBSETS = {
+    "draft": AGENT_TOOLS,
+    "sent": [tools_by_name["Done"]],
+}
+# Marker in the write_email tool output (agent_tools prefixes it with an
+# emoji); tool_handler reports failures as "Error running ..." instead
+_EMAIL_SENT_MARKER = "Email sent to"
+
+bound_llms = {
+    "draft": llm_with_tools,
+    "sent": llm.bind_tools(TOOL_SUBSETS["sent"], tool_choice="any", prompt_cache_key=PROMPT_CACHE_KEY),
+}
+
+# System prompts only depend on constants, so format them once at import
+TRIAGE_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": TRIAGE_SYSTEM_PROMPT.format(background=DEFAULT_BACKGROUND, triage_instructions=DEFAULT_TRIAGE_INSTRUCTIONS),
+}
+AGENT_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": AGENT_SYSTEM_PROMPT.format(
+        tools_prompt=AGENT_TOOLS_PROMPT,
+        background=DEFAULT_BACKGROUND,
+        response_preferences=DEFAULT_RESPONSE_PREFERENCES,
+        cal_preferences=DEFAULT_CAL_PREFERENCES,
+    ),
+}
+
+# Cache LLM results; only deterministic (temperature 0) calls are cacheable
+llm_cache = LLMCache(redis_url=os.getenv("LLM_CACHE_REDIS_URL"))
+use_llm_cache = LLM_TEMPERATURE == 0
+
+# Optional semantic cache that reuses triage labels for near-duplicate emails.
+# Triage depends on who sent the email, so entries are partitioned by sender.
+triage_semantic_cache = None
+if os.getenv("TRIAGE_SEMANTIC_CACHE", "").lower() in ("1", "true"):
+    triage_semantic_cache = SemanticCache(
+        init_embeddings("openai:text-embedding-3-small"),
+        threshold=float(os.getenv("TRIAGE_SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    )
 
-# Create tool-enabled LLM for response generation
-tools_by_name = {tool.name: tool for tool in TOOLS}
-llm_with_tools = llm.bind_tools(TOOLS, tool_choice="any")
+async def classify_email(author: str, to: str, subject: str, email_thread: str) -> RouterSchema:
+    """Classify an email with the router LLM, using the response caches when possible."""
+    user_prompt = TRIAGE_USER_PROMPT.format(
+        author=author, to=to, subject=subject, email_thread=email_thread
+    )
 
-def triage_router(state: State):
+    messages = [TRIAGE_SYSTEM_MESSAGE, {"role": "user", "content": user_prompt}]
+    key = cache_key(ROUTER_MODEL, messages, LLM_TEMPERATURE, response_format=RouterSchema.__name__)
+    cached = await llm_cache.aget(key) if use_llm_cache else None
+    if cached is None and triage_semantic_cache is not None:
+        sender = author.strip().lower()
+        query_vector = await triage_semantic_cache.aembed(f"{subject}\n{email_thread[:512]}")
+        cached = triage_semantic_cache.lookup(query_vector, sender)
+    if cached is not None:
+        return RouterSchema(**cached)
+
+    result = await llm_router.ainvoke(messages)
+    if use_llm_cache:
+        await llm_cache.aset(key, result.model_dump())
+    if triage_semantic_cache is not None:
+        triage_semantic_cache.put(query_vector, result.model_dump(), sender)
+    return result
+
+async def triage_router(state: State):
     """Analyze email content to decide if we should respond, notify, or ignore."""
     # print("INcoming State: ", state)
     # parse email
     author, to, subject, email_thread = parse_email(state["email_input"])
 
-    system_prompt = TRIAGE_SYSTEM_PROMPT.format(background=DEFAULT_BACKGROUND, triage_instructions=DEFAULT_TRIAGE_INSTRUCTIONS)
-
-    user_prompt = TRIAGE_USER_PROMPT.format(
-        author=author, to=to, subject=subject, email_thread=email_thread
-    )
-
-    result = llm_router.invoke([
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt},
-    ])
+    # Obvious cases (auto-replies, bulk notifications) don't need the LLM
+    pre_classification = fast_triage(author, subject, email_thread)
+    if pre_classification is not None:
+        classification, reasoning = pre_classification
+        result = RouterSchema(reasoning=reasoning, classification=classification)
+    else:
+        result = await classify_email(author, to, subject, email_thread)
 
-    print(f"📋 Email Triage: {result.classification.upper()}")
+    logger.info("email.triage classification=%s", result.classification)
 
     if result.classification == "respond":
-        print("📧 Routing to response agent...")
+        logger.info("email.route target=response_agent")
         goto = "response_agent"
         update = {
             "classification_decision": result.classification,
@@ -54,11 +155,11 @@ def triage_router(state: State):
         }
 
     elif result.classification == "ignore":
-        print("🚫 Email will be ignored")
+        logger.info("email.route target=end reason=ignore")
         goto= END
         update = {"classification_decision": result.classification}
     elif result.classification == "notify":
-        print("🔔 Email marked for notification only")
+        logger.info("email.route target=end reason=notify")
         goto= END
         update = {"classification_decision": result.classification}
     else:
@@ -66,82 +167,118 @@ def triage_router(state: State):
 
     return Command(goto=goto, update=update)
 
-def llm_call(state: State):
-    """LLM decides which tool to call or if processing is complete."""
-    system_prompt = AGENT_SYSTEM_PROMPT.format(
-        background=DEFAULT_BACKGROUND,
-        response_preferences=DEFAULT_RESPONSE_PREFERENCES,
-        cal_preferences=DEFAULT_CAL_PREFERENCES, 
+def select_tool_subset(state: State) -> str:
+    """Pick the TOOL_SUBSETS key for the next LLM call.
+    
+    Only a successful write_email result counts as sent; a failed call is
+    reported as an error and the LLM still needs the full tool set to retry.
+    """
+    for message in reversed(state["messages"]):
+        if getattr(message, "type", None) != "tool":
+            break
+        content = message.content
+        if isinstance(content, str) and not content.startswith("Error") and _EMAIL_SENT_MARKER in content:
+            return "sent"
+    return "draft"
+
+def should_continue(last_message) -> Literal["tool_handler", "__end__"]:
+    """Determine if we should continue with tools or end processing."""
+    
+    tool_calls = last_message.tool_calls
+    if not tool_calls:
+        return END
+
+    # Special handling for Done tool - signals completion
+    if any(tc["name"] == "Done" for tc in tool_calls):
+        logger.info("email.processing complete")
+        return END
+    return "tool_handler"
+
+async def llm_call(state: State) -> Command[Literal["tool_handler", "__end__"]]:
+    """LLM decides which tool to call or if processing is complete.
+    
+    Routing is decided here, from the fresh message, so the next step doesn't
+    have to read it back out of the state.
+    """
+    subset = select_tool_subset(state)
+    # Combine system prompt with conversation history
+    messages = [AGENT_SYSTEM_MESSAGE] + state["messages"]
+    key = cache_key(LLM_MODEL, messages, LLM_TEMPERATURE, tools=[tool.name for tool in TOOL_SUBSETS[subset]])
+    cached = await llm_cache.aget(key) if use_llm_cache else None
+    if cached is not None:
+        response = messages_from_dict([cached])[0]
+    else:
+        # Stream so token callbacks (and `astream_email_tokens`) see output as it is generated
+        response = None
+        async for chunk in bound_llms[subset].astream(messages):
+            response = chunk if response is None else response + chunk
+        if response is None:
+            # Nothing was streamed back; ask again without streaming
+            response = await bound_llms[subset].ainvoke(messages)
+        response = message_chunk_to_message(response)
+        if use_llm_cache:
+            cached = message_to_dict(response)
+            # Let the state reducer assign a fresh id on every hit
+            cached["data"]["id"] = None
+            await llm_cache.aset(key, cached)
+
+    return Command(goto=should_continue(response), update={"messages": [response]})
+
+async def tool_handler(state: State):
+    """Execute the tool calls from the LLM concurrently."""
+    tool_calls = state["messages"][-1].tool_calls
+    get_tool = tools_by_name.__getitem__
+
+    # Tool calls are independent of each other, so run them all at once.
+    # Sync-only tools are moved to a worker thread by `ainvoke` itself.
+    observations = await asyncio.gather(
+        *[get_tool(tc["name"]).ainvoke(tc["args"]) for tc in tool_calls],
+        return_exceptions=True,
     )
 
-    # Combine system prompt with conversation history
-    return {
-        "messages": [
-            llm_with_tools.invoke([
-                {"role": "system", "content": system_prompt}
-            ] + state["messages"])
-        ]
-    }
+    # A failing tool shouldn't discard its siblings' results; report it to the LLM instead.
+    # tool_call_id is required for the LLM to track tool results
+    result = [
+        {
+            "role": "tool",
+            "content": f"Error running {tc['name']}: {obs}" if isinstance(obs, Exception) else str(obs),
+            "tool_call_id": tc["id"],
+        }
+        for tc, obs in zip(tool_calls, observations)
+    ]
+    logger.info("tool.executed names=%s", [tc["name"] for tc in tool_calls])
 
-def tool_handler(state: State):
-    """Execute the tool calls from the LLM."""
-    last_message = state["messages"][-1]
-    result = []
-
-    # Execute each tool call and capture results
-    for tool_call in last_message.tool_calls:
-        tool = tools_by_name[tool_call["name"]]
-        observation = tool.invoke(tool_call["args"])
-        result.append({
-            "role": "tool", 
-            "content": str(observation), 
-            "tool_call_id": tool_call["id"]  # Required for LLM to track tool results
-        })
-        print(f"🔧 Tool executed: {tool_call['name']}")
-    
     return {"messages": result}
 
-def should_continue(state: State) -> Literal["tool_handler", "__end__"]:
-    """Determine if we should continue with tools or end processing."""
-    
-    last_message = state["messages"][-1]
-    
-    if last_message.tool_calls:
-        # Special handling for Done tool - signals completion
-        for tool_call in last_message.tool_calls:
-            if tool_call["name"] == "Done":
-                print("✅ Processing complete")
-                return END
-        return "tool_handler"
-    
-    return END
+def triage_cache_key(state: State) -> str:
+    """Node cache key for triage_router: the raw email input."""
+    return hashlib.sha256(json.dumps(state["email_input"], sort_keys=True).encode()).hexdigest()
+
+def llm_call_cache_key(state: State) -> str:
+    """Node cache key for llm_call: the conversation so far."""
+    return cache_key(LLM_MODEL, state["messages"], LLM_TEMPERATURE, tools=tools_by_name)
+
+# Retried or replayed inputs skip the LLM nodes entirely on a node cache hit
+node_cache = InMemoryCache()
 
 # Build the response agent (subgraph for handling tool-calling workflow)
 response_agent = StateGraph(State)
-response_agent.add_node("llm_call", llm_call)
+response_agent.add_node("llm_call", llm_call, cache_policy=CachePolicy(key_func=llm_call_cache_key, ttl=3600))
 response_agent.add_node("tool_handler", tool_handler)
 
 response_agent.add_edge(START, "llm_call")
-# Conditional routing: continue with tools or finish
-response_agent.add_conditional_edges(
-    "llm_call",
-    should_continue,
-    {
-        "tool_handler": "tool_handler",
-        END: END,
-    },
-)
+# Note: llm_call uses Command to route to tool_handler or finish
 
 # Loop back to LLM after tool execution
 response_agent.add_edge("tool_handler", "llm_call")
 
-compiled_response_agent = response_agent.compile()
+compiled_response_agent = response_agent.compile(cache=node_cache)
 
 
 
 # # Build the overall workflow (main graph)
 email_assistant = StateGraph(State)
-email_assistant.add_node("triage_router", triage_router)
+email_assistant.add_node("triage_router", triage_router, cache_policy=CachePolicy(key_func=triage_cache_key, ttl=3600))
 email_assistant.add_node("response_agent", compiled_response_agent)
 
 email_assistant.add_edge(START, "triage_router")
@@ -149,50 +286,147 @@ email_assistant.add_edge(START, "triage_router")
 
 
 # Compile the final agent
-compiled_email_assistant = email_assistant.compile()
+compiled_email_assistant = email_assistant.compile(cache=node_cache)
+
+# Checkpointed variant for emails with a stable id: a retry of a failed run
+# resumes after the last completed node instead of re-running triage. Only
+# unfinished runs keep their checkpoints; a finished run's thread is deleted and
+# its result kept in a bounded cache, so memory doesn't grow with every email.
+# Both live in this process, so a restart starts every email over.
+checkpointer = InMemorySaver()
+checkpointed_email_assistant = email_assistant.compile(checkpointer=checkpointer, cache=node_cache)
+_FINISHED_EMAILS = LRUCache(maxsize=1024, ttl=3600.0)
+
+
+class EmailIdConflictError(ValueError):
+    """An email id was reused for a different email."""
+
+
+def _check_same_email(email_id: str, stored: dict, email_input: dict) -> None:
+    if stored != email_input:
+        raise EmailIdConflictError(f"Email id {email_id} was already used for a different email")
 
 
-def process_email(email_input: dict) -> dict:
+def _summarize_result(result: dict) -> dict:
+    """Reduce a finished workflow state to the classification and reply."""
+    response_text = "No response generated"
+
+    # Walk backwards: the final write_email call sits at the end of the conversation
+    for message in reversed(result.get("messages", [])):
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            # Extract the email content from the write_email tool arguments
+            email_content = next(
+                (tc.get("args", {}).get("content", "") for tc in tool_calls if tc.get("name") == "write_email"),
+                "",
+            )
+            if email_content:
+                response_text = email_content
+                break
+        # Fallback: assistant messages with actual content
+        elif getattr(message, "type", None) == "ai" and message.content.strip():
+            response_text = message.content
+            break
+
+    return {
+        "classification": result.get("classification_decision", "unknown"),
+        "response": response_text,
+        "reasoning": f"Email classified as: {result.get('classification_decision', 'unknown')}"
+    }
+
+
+async def aprocess_email(email_input: dict, email_id: Optional[str] = None) -> dict:
     """
     Process an email through the complete workflow.
     
     Args:
         email_input: Dictionary with keys: author, to, subject, email_thread
+        email_id: Optional stable id of the email. When given, progress is
+            checkpointed under this id so retrying a failed email resumes
+            where it stopped, and re-processing a recently finished one
+            returns its earlier result.
         
     Returns:
         Dictionary with processing results
+        
+    Raises:
+        EmailIdConflictError: If `email_id` was already used for a different email
     """
-    result = compiled_email_assistant.invoke({"email_input": email_input})
+    if email_id is None:
+        return _summarize_result(await compiled_email_assistant.ainvoke({"email_input": email_input}))
+
+    finished = _FINISHED_EMAILS.get(email_id)
+    if finished is not None:
+        stored_input, summary = finished
+        _check_same_email(email_id, stored_input, email_input)
+        return dict(summary)
+
+    config = {"configurable": {"thread_id": email_id}}
+    snapshot = await checkpointed_email_assistant.aget_state(config)
+    if snapshot.next:
+        # A previous attempt stopped part-way: resume from its last checkpoint
+        _check_same_email(email_id, snapshot.values["email_input"], email_input)
+        result = await checkpointed_email_assistant.ainvoke(None, config)
+    else:
+        result = await checkpointed_email_assistant.ainvoke({"email_input": email_input}, config)
 
-    # Extract meaningful response from the conversation
-    response_text = "No response generated"
+    summary = _summarize_result(result)
+    _FINISHED_EMAILS.set(email_id, (email_input, dict(summary)))
+    await checkpointer.adelete_thread(email_id)
+    return summary
 
-    if result.get("messages"):
-        # Look for the actual email content in tool calls (write_email tool)
-        for message in result["messages"]:
-            # Check if this is an assistant message with tool calls
-            if (hasattr(message, 'tool_calls') and message.tool_calls):
-                for tool_call in message.tool_calls:
-                    if tool_call.get('name') == 'write_email':
-                        # Extract the email content from the tool arguments
-                        args = tool_call.get('args', {})
-                        email_content = args.get('content', '')
-                        if email_content:
-                            response_text = email_content
-                            break
-                if response_text != "No response generated":
-                    break
-            # Fallback: look for assistant messages with actual content
-            elif (hasattr(message, 'role') and message.role == "assistant" and 
-                  hasattr(message, 'content') and message.content.strip()):
-                response_text = message.content
-                break
 
-    return {
-        "classification": result.get("classification_decision", "unknown"),
-        "response": response_text,
-        "reasoning": f"Email classified as: {result.get('classification_decision', 'unknown')}"
-    }
+async def astream_email_tokens(email_input: dict) -> AsyncIterator[AIMessageChunk]:
+    """
+    Stream LLM output chunks while an email is processed.
+    
+    Args:
+        email_input: Dictionary with keys: author, to, subject, email_thread
+        
+    Yields:
+        Message chunks as the model generates them, including the partial
+        tool call arguments that carry the email draft
+    """
+    async for event in compiled_email_assistant.astream_events({"email_input": email_input}, version="v2"):
+        if event["event"] == "on_chat_model_stream":
+            yield event["data"]["chunk"]
+
+
+def process_email(email_input: dict, email_id: Optional[str] = None) -> dict:
+    """Synchronous wrapper around `aprocess_email` for non-async callers.
+    
+    It runs the workflow on its own event loop, so it can't be called while a
+    loop is already running (async code, Jupyter notebooks, async tests);
+    there, use `await aprocess_email(...)` instead.
+    
+    Raises:
+        RuntimeError: If called from a running event loop
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError(
+            "process_email can't run inside a running event loop; use `await aprocess_email(...)` instead"
+        )
+    return asyncio.run(aprocess_email(email_input, email_id))
+
+
+async def process_emails_batch(inputs: list[dict]) -> list[dict]:
+    """
+    Process several emails concurrently.
+    
+    Each email runs through its own graph invocation; the LLM and tool calls
+    are I/O-bound, so overlapping them collapses the batch wall-clock time.
+    
+    Args:
+        inputs: List of email dictionaries (see `aprocess_email`)
+        
+    Returns:
+        List of processing results, in the same order as `inputs`
+    """
+    return await asyncio.gather(*(aprocess_email(email_input) for email_input in inputs))
 
 
 
@@ -1,13 +1,24 @@
 """Email assistant agent with Human-in-the-Loop (HITL) capabilities."""
 
+import asyncio
+import atexit
+import logging
 import os
+import threading
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from functools import partial
+from itertools import chain
 from typing import Literal
 from langchain.chat_models import init_chat_model
+from langchain_core.messages import convert_to_messages, get_buffer_string
 from langgraph.graph import StateGraph, START, END
-from langgraph.store.base import BaseStore
+from langgraph.store.base import BaseStore, GetOp, PutOp
 from langgraph.store.redis import RedisStore
 from langgraph.types import Command, interrupt
-from langgraph.checkpoint.redis import RedisSaver
+from langgraph.checkpoint.redis import AsyncRedisSaver
 from dotenv import load_dotenv
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.store.memory import InMemoryStore
@@ -19,33 +30,149 @@ from .tools.default.prompt_templates import HITL_TOOLS_PROMPT
 from .prompts import (
     TRIAGE_SYSTEM_PROMPT, 
     TRIAGE_USER_PROMPT,
+    TRIAGE_BATCH_USER_PROMPT,
     AGENT_SYSTEM_PROMPT_HITL,
     DEFAULT_BACKGROUND,
     DEFAULT_TRIAGE_INSTRUCTIONS,
     DEFAULT_RESPONSE_PREFERENCES,
     DEFAULT_CAL_PREFERENCES,
     MEMORY_UPDATE_INSTRUCTIONS,
-    MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT
+    MEMORY_UPDATE_INSTRUCTIONS_MULTI,
+    MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT,
+    MEMORY_UPDATE_PROFILE,
 )
-from .schemas import State, RouterSchema, StateInput, UserPreferences
+from .batching import MicroBatcher
+from .clients import http_client, http_async_client
+from .llm_cache import LRUCache
+from .schemas import State, RouterSchema, BatchRouterSchema, StateInput, UserPreferences, MultiProfileUpdate
 from .utils import parse_email, format_email_markdown, format_for_display
 
 # CRITICAL: Load environment variables before LLM initialization
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Get tools
 tools = get_tools(["write_email", "schedule_meeting", "check_calendar_availability", "Question", "Done"])
 tools_by_name = get_tools_by_name(tools)
+# Pre-resolved tool.invoke methods for the tool-call hot path
+_INVOKERS = {name: tool.invoke for name, tool in tools_by_name.items()}
+
+# Tools that require human approval before they run
+_HITL_TOOLS = frozenset({"write_email", "schedule_meeting", "Question"})
+
+# Worker threads for running independent auto-executed tool calls concurrently
+_TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hitl-tools")
+
+# Background worker for memory updates, so they stay off the HITL response path.
+# A single worker applies updates in order, so read-modify-write updates of the
+# same profile never race; pending updates finish before the process exits.
+_MEM_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hitl-memory")
+atexit.register(_MEM_EXECUTOR.shutdown, wait=True)
+
+# Allowed human actions per HITL tool, shown in Agent Inbox
+_CFG_EMAIL = {
+    "allow_ignore": True,    # User can cancel email
+    "allow_respond": True,   # User can provide feedback
+    "allow_edit": True,      # User can edit email content
+    "allow_accept": True,    # User can approve as-is
+}
+_CFG_MEETING = {
+    "allow_ignore": True,    # User can cancel meeting
+    "allow_respond": True,   # User can provide feedback
+    "allow_edit": True,      # User can edit meeting details
+    "allow_accept": True,    # User can approve as-is
+}
+_CFG_QUESTION = {
+    "allow_ignore": True,    # User can skip question
+    "allow_respond": True,   # User can answer question
+    "allow_edit": False,     # Questions can't be edited
+    "allow_accept": False,   # Questions need answers, not acceptance
+}
+_CFG_BY_TOOL = {
+    "write_email": _CFG_EMAIL,
+    "schedule_meeting": _CFG_MEETING,
+    "Question": _CFG_QUESTION,
+}
+_CFG_NOTIFY = {
+    "allow_ignore": True,   # User can ignore the notification
+    "allow_respond": True,  # User can provide feedback to respond
+    "allow_edit": False,    # No editing needed for notifications
+    "allow_accept": False,  # No acceptance needed for notifications
+}
 
 # Initialize LLM with low temperature for consistent responses
-llm = init_chat_model("openai:gpt-4.1", temperature=0.0)
+# All LLM wrappers below derive from this one model, which is built on the shared
+# HTTP clients, so every call reuses one connection pool
+llm = init_chat_model(
+    "openai:gpt-4.1",
+    temperature=0.0,
+    http_client=http_client,
+    http_async_client=http_async_client,
+)
 
 # Create specialized LLM for structured triage decisions
 llm_router = llm.with_structured_output(RouterSchema)
 
+# Create specialized LLM for triaging several emails in one call
+llm_router_batch = llm.with_structured_output(BatchRouterSchema)
+
 # Initialize the LLM, enforcing tool use (of any available tools) for agent
 llm_with_tools = llm.bind_tools(tools, tool_choice="required")
 
+# Once the email has been sent only Done is a sensible next step, so bind just
+# that tool and send a much smaller tool schema
+_LLM_AFTER_SEND = llm.bind_tools([tools_by_name["Done"]], tool_choice="required")
+_LLM_FULL = llm_with_tools
+
+# Prefix of the write_email tool output, i.e. the email was actually sent
+_EMAIL_SENT_PREFIX = "Email sent to"
+
+# Create specialized LLM for structured memory profile updates
+llm_memory = llm.with_structured_output(UserPreferences)
+
+# Create specialized LLM for updating several memory profiles in one call
+llm_memory_multi = llm.with_structured_output(MultiProfileUpdate)
+
+# Process-local caches of memory profiles, one per store (so graphs with
+# different stores never share entries) keyed by namespace. Profiles rarely
+# change within a session, so repeated reads skip the store round-trip. Every
+# write in this process drops the cached entry; writes made by other worker
+# processes become visible once the entry's TTL expires.
+_MEM_CACHES: "weakref.WeakKeyDictionary[BaseStore, LRUCache]" = weakref.WeakKeyDictionary()
+_MEM_CACHES_LOCK = threading.Lock()
+
+
+def _mem_cache(store) -> LRUCache:
+    """Get the memory profile cache of a store."""
+    cache = _MEM_CACHES.get(store)
+    if cache is None:
+        with _MEM_CACHES_LOCK:
+            cache = _MEM_CACHES.get(store)
+            if cache is None:
+                cache = _MEM_CACHES[store] = LRUCache(maxsize=64, ttl=30.0)
+    return cache
+
+
+# System prompts are formatted once with their constant parts at import; only
+# the memory profiles are filled in per call
+_PROMPT_SPLIT = "\x00SPLIT\x00"
+_TRIAGE_PREFIX, _TRIAGE_SUFFIX = TRIAGE_SYSTEM_PROMPT.format(
+    background=DEFAULT_BACKGROUND,
+    triage_instructions=_PROMPT_SPLIT,
+).split(_PROMPT_SPLIT)
+_AGENT_PREFIX, _AGENT_MIDDLE, _AGENT_SUFFIX = AGENT_SYSTEM_PROMPT_HITL.format(
+    tools_prompt=HITL_TOOLS_PROMPT,
+    background=DEFAULT_BACKGROUND,
+    response_preferences=_PROMPT_SPLIT,
+    cal_preferences=_PROMPT_SPLIT,
+).split(_PROMPT_SPLIT)
+
+
+def _chain(*seqs):
+    """Concatenate message sequences into one new list, without intermediate copies."""
+    return list(chain.from_iterable(seqs))
+
 
 def get_memory(store, namespace, default_content=None):
     """Get memory from the store or initialize with default if it doesn't exist.
@@ -58,12 +185,19 @@ def get_memory(store, namespace, default_content=None):
     Returns:
         str: The content of the memory profile, either from existing memory or the default
     """
+    # Serve recently read profiles from the process-local cache
+    cache = _mem_cache(store)
+    cached = cache.get(namespace)
+    if cached is not None:
+        return cached
+
     # Search for existing memory with namespace and key
     user_preferences = store.get(namespace, "user_preferences")
 
-    print(f"Searching for user preferences in namespace {namespace}...")
+    logger.debug("Searching for user preferences in namespace %s", namespace)
     # If memory exists, return its content (the value)
     if user_preferences:
+        cache.set(namespace, user_preferences.value)
         return user_preferences.value
     
     # If memory doesn't exist, add it to the store and return the default content
@@ -71,36 +205,180 @@ def get_memory(store, namespace, default_content=None):
         # Namespace, key, value
         store.put(namespace, "user_preferences", default_content)
         user_preferences = default_content
+        cache.set(namespace, user_preferences)
     
-    print("final_user_preferences:", user_preferences)
+    logger.debug("Initialized user preferences in namespace %s with defaults", namespace)
     # Return the default content
     return user_preferences 
 
 
+def get_memories_bulk(store, items):
+    """Get several memory profiles from the store in a single batch.
+
+    Missing profiles are initialized with their defaults in one follow-up batch.
+
+    Args:
+        store: LangGraph BaseStore instance to search for existing memory
+        items: List of (namespace, default_content) tuples
+
+    Returns:
+        list: The content of each memory profile, in the order of items
+    """
+    cache = _mem_cache(store)
+    contents = [cache.get(namespace) for namespace, _ in items]
+    uncached = [i for i, content in enumerate(contents) if content is None]
+    if not uncached:
+        return contents
+
+    results = store.batch([GetOp(items[i][0], "user_preferences") for i in uncached])
+
+    missing = []
+    for i, item in zip(uncached, results):
+        namespace, default_content = items[i]
+        if item:
+            contents[i] = item.value
+        else:
+            contents[i] = default_content
+            missing.append(PutOp(namespace, "user_preferences", default_content))
+        cache.set(namespace, contents[i])
+
+    if missing:
+        store.batch(missing)
+
+    return contents
+
+
 def update_memory(store, namespace, messages):
     """Update memory profile in the store.
     
     Args:
         store: LangGraph BaseStore instance to update memory
         namespace: Tuple defining the memory namespace, e.g. ("email_assistant", "triage_preferences")
-        messages: List of messages to update the memory with
+        messages: Messages to update the memory with (any iterable)
     """
     # Get the existing memory
     user_preferences = store.get(namespace, "user_preferences")
     # Handle case where memory doesn't exist yet
     current_profile = user_preferences.value if user_preferences else "No existing preferences"
     # Update the memory
-    llm_memory = init_chat_model("openai:gpt-4.1", temperature=0.0).with_structured_output(UserPreferences)
-    result = llm_memory.invoke(
-        [
-            {"role": "system", "content": MEMORY_UPDATE_INSTRUCTIONS.format(current_profile=current_profile, namespace=namespace)},
-        ] + messages
-    )
+    result = llm_memory.invoke(_chain(
+        [{"role": "system", "content": MEMORY_UPDATE_INSTRUCTIONS.format(current_profile=current_profile, namespace=namespace)}],
+        messages,
+    ))
 
-    print("to_update_final_user_preferences:", result)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Updated user preferences in namespace %s: %r", namespace, result)
 
     # Save the updated memory to the store
     store.put(namespace, "user_preferences", result.user_preferences)
+    _mem_cache(store).pop(namespace)
+
+
+def update_memories(store, updates):
+    """Update several memory profiles in the store with a single LLM call.
+    
+    Args:
+        store: LangGraph BaseStore instance to update memory
+        updates: Queued memory updates, each with a namespace and the messages to update it with
+    """
+    namespaces = list(dict.fromkeys(tuple(update["namespace"]) for update in updates))
+
+    # Get the existing memories in one batch
+    items = store.batch([GetOp(namespace, "user_preferences") for namespace in namespaces])
+    profiles = "\n\n".join(
+        MEMORY_UPDATE_PROFILE.format(
+            name=namespace[-1],
+            current_profile=item.value if item else "No existing preferences",
+        )
+        for namespace, item in zip(namespaces, items)
+    )
+
+    # Tag each update's messages with the profile they apply to
+    feedback = [
+        {
+            "role": "user",
+            "content": f"<feedback profile=\"{update['namespace'][-1]}\">\n{get_buffer_string(convert_to_messages(update['messages']))}\n</feedback>",
+        }
+        for update in updates
+    ]
+    result = llm_memory_multi.invoke(
+        [{"role": "system", "content": MEMORY_UPDATE_INSTRUCTIONS_MULTI.format(profiles=profiles)}] + feedback
+    )
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Updated user preferences in namespaces %s: %r", namespaces, result)
+
+    # Save the updated memories to the store in one batch
+    puts = [
+        PutOp(namespace, "user_preferences", getattr(result, namespace[-1]))
+        for namespace in namespaces
+        if getattr(result, namespace[-1], None)
+    ]
+    if puts:
+        store.batch(puts)
+    cache = _mem_cache(store)
+    for namespace in namespaces:
+        cache.pop(namespace)
+
+
+def memory_update(namespace, messages):
+    """Build a memory update to queue in state until the run ends.
+    
+    Args:
+        namespace: Tuple defining the memory namespace, e.g. ("email_assistant", "triage_preferences")
+        messages: List of messages to update the memory with
+    """
+    return {"id": uuid.uuid4().hex, "namespace": namespace, "messages": messages}
+
+
+def classify_emails(prompts):
+    """Classify several emails, sharing one LLM call per system prompt.
+    
+    Args:
+        prompts: List of (system_prompt, user_prompt) tuples, one per email
+        
+    Returns:
+        list: RouterSchema for each email, in the order of prompts
+    """
+    results = [None] * len(prompts)
+
+    # Emails triaged with different preferences can't share a system prompt
+    groups = {}
+    for i, (system_prompt, _) in enumerate(prompts):
+        groups.setdefault(system_prompt, []).append(i)
+
+    for system_prompt, indices in groups.items():
+        if len(indices) > 1:
+            emails = "".join(f"\n\nEmail {n}:{prompts[i][1]}" for n, i in enumerate(indices, 1))
+            batch = llm_router_batch.invoke([
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": TRIAGE_BATCH_USER_PROMPT.format(count=len(indices), emails=emails)},
+            ])
+            if len(batch.classifications) == len(indices):
+                for i, result in zip(indices, batch.classifications):
+                    results[i] = result
+                continue
+            logger.warning("Batched triage returned %d classifications for %d emails, retrying one by one",
+                           len(batch.classifications), len(indices))
+
+        for i in indices:
+            results[i] = llm_router.invoke([
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompts[i][1]},
+            ])
+
+    return results
+
+
+# Opt-in micro-batching of triage calls across concurrently processed emails.
+# Set TRIAGE_BATCH_SIZE > 1 to classify up to that many emails per LLM call,
+# waiting at most TRIAGE_BATCH_WAIT_MS for a batch to fill.
+TRIAGE_BATCH_SIZE = int(os.getenv("TRIAGE_BATCH_SIZE", "1"))
+_TRIAGE_BATCHER = MicroBatcher(
+    classify_emails,
+    max_batch_size=TRIAGE_BATCH_SIZE,
+    max_wait=float(os.getenv("TRIAGE_BATCH_WAIT_MS", "50")) / 1000,
+) if TRIAGE_BATCH_SIZE > 1 else None
 
 
 def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_interrupt_handler", "response_agent", "__end__"]]:
@@ -117,21 +395,21 @@ def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_int
     triage_instructions = get_memory(store, ("email_assistant", "triage_preferences"), DEFAULT_TRIAGE_INSTRUCTIONS)
     
     # Format system prompt with background and triage instructions
-    system_prompt = TRIAGE_SYSTEM_PROMPT.format(
-        background=DEFAULT_BACKGROUND,
-        triage_instructions=triage_instructions
-    )
+    system_prompt = _TRIAGE_PREFIX + triage_instructions + _TRIAGE_SUFFIX
 
     # Format user prompt with email details
     user_prompt = TRIAGE_USER_PROMPT.format(
         author=author, to=to, subject=subject, email_thread=email_thread
     )
 
-    # Get structured classification from LLM
-    result = llm_router.invoke([
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt},
-    ])
+    # Get structured classification from LLM, batched with other emails if enabled
+    if _TRIAGE_BATCHER is not None:
+        result = _TRIAGE_BATCHER.submit((system_prompt, user_prompt))
+    else:
+        result = llm_router.invoke([
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ])
     
     # Decision
     classification = result.classification
@@ -140,19 +418,20 @@ def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_int
     
     # Process the classification decision
     if classification == "respond":
-        print("📧 Classification: RESPOND - This email requires a response")
+        logger.debug("Classification: RESPOND - This email requires a response")
         # Next node
         goto = "response_agent"
         # Update the state
         update = {
             "classification_decision": classification,
+            "email_markdown": email_markdown,
             "messages": [{"role": "user",
                             "content": f"Respond to the email: {email_markdown}"
                         }],
         }
         
     elif classification == "ignore":
-        print("🚫 Classification: IGNORE - This email can be safely ignored")
+        logger.debug("Classification: IGNORE - This email can be safely ignored")
         # Next node
         goto = END
         # Update the state
@@ -161,12 +440,13 @@ def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_int
         }
         
     elif classification == "notify":
-        print("🔔 Classification: NOTIFY - This email contains important information") 
+        logger.debug("Classification: NOTIFY - This email contains important information")
         # This is new! 
         goto = "triage_interrupt_handler"
         # Update the state
         update = {
             "classification_decision": classification,
+            "email_markdown": email_markdown,
         }
         
     else:
@@ -175,7 +455,7 @@ def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_int
     return Command(goto=goto, update=update)
 
 
-def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal["response_agent", "__end__"]]:
+def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal["response_agent", "flush_memory"]]:
     """Handle interrupts from the triage step when email is classified as 'notify'.
     
     This allows humans to review notification emails and decide whether to:
@@ -183,9 +463,8 @@ def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal[
     - Provide feedback to respond to the email (continue to response agent)
     """
     
-    # Parse the email input for display
-    author, to, subject, email_thread = parse_email(state["email_input"])
-    email_markdown = format_email_markdown(subject, author, to, email_thread)
+    # Email formatted for display by triage_router
+    email_markdown = state["email_markdown"]
 
     # Create messages for the response agent if user chooses to respond
     messages = [{
@@ -199,12 +478,7 @@ def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal[
             "action": f"Email Assistant: {state['classification_decision']}",
             "args": {}
         },
-        "config": {
-            "allow_ignore": True,   # User can ignore the notification
-            "allow_respond": True,  # User can provide feedback to respond
-            "allow_edit": False,    # No editing needed for notifications
-            "allow_accept": False,  # No acceptance needed for notifications
-        },
+        "config": _CFG_NOTIFY,
         # Email content to show in Agent Inbox
         "description": email_markdown,
     }
@@ -220,11 +494,11 @@ def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal[
             "role": "user",
             "content": f"User wants to reply to the email. Use this feedback to respond: {user_input}"
         })
-        # Update memory with feedback
-        update_memory(store, ("email_assistant", "triage_preferences"), [{
+        # Queue memory update with feedback
+        memory_updates = [memory_update(("email_assistant", "triage_preferences"), _chain([{
             "role": "user",
             "content": f"The user decided to respond to the email, so update the triage preferences to capture this."
-        }] + messages)
+        }], messages))]
         goto = "response_agent"
 
     elif response["type"] == "ignore":
@@ -233,9 +507,9 @@ def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal[
             "role": "user",
             "content": f"The user decided to ignore the email even though it was classified as notify. Update triage preferences to capture this."
         })
-        # Update memory with feedback 
-        update_memory(store, ("email_assistant", "triage_preferences"), messages)
-        goto = END
+        # Queue memory update with feedback 
+        memory_updates = [memory_update(("email_assistant", "triage_preferences"), list(messages))]
+        goto = "flush_memory"
 
     else:
         raise ValueError(f"Invalid response type: {response}")
@@ -243,37 +517,174 @@ def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal[
     # Update state with messages for response agent AND preserve classification
     update = {
         "messages": messages,
-        "classification_decision": state["classification_decision"]  # Preserve original classification
+        "classification_decision": state["classification_decision"],  # Preserve original classification
+        "pending_memory_updates": memory_updates,
     }
     return Command(goto=goto, update=update)
 
 
+def _email_sent(messages):
+    """Check whether the latest batch of tool results includes a sent email."""
+    for message in reversed(messages):
+        if getattr(message, "type", None) != "tool":
+            return False
+        if isinstance(message.content, str) and message.content.startswith(_EMAIL_SENT_PREFIX):
+            return True
+    return False
+
+
 def llm_call(state: State, store: BaseStore):
     """LLM decides which tool to call using HITL-enabled prompt."""
     
-    # Search for existing cal_preferences memory
-    cal_preferences = get_memory(store, ("email_assistant", "cal_preferences"), DEFAULT_CAL_PREFERENCES)
-    
-    # Search for existing response_preferences memory
-    response_preferences = get_memory(store, ("email_assistant", "response_preferences"), DEFAULT_RESPONSE_PREFERENCES)
+    # Fetch cal_preferences and response_preferences memory in one round-trip
+    cal_preferences, response_preferences = get_memories_bulk(store, [
+        (("email_assistant", "cal_preferences"), DEFAULT_CAL_PREFERENCES),
+        (("email_assistant", "response_preferences"), DEFAULT_RESPONSE_PREFERENCES),
+    ])
     
     # Format system prompt with all context
-    system_prompt = AGENT_SYSTEM_PROMPT_HITL.format(
-        tools_prompt=HITL_TOOLS_PROMPT,
-        background=DEFAULT_BACKGROUND,
-        response_preferences=response_preferences,
-        cal_preferences=cal_preferences,
-    )
+    system_prompt = "".join((_AGENT_PREFIX, response_preferences, _AGENT_MIDDLE, cal_preferences, _AGENT_SUFFIX))
     
+    model = _LLM_AFTER_SEND if _email_sent(state["messages"]) else _LLM_FULL
     return {
         "messages": [
-            llm_with_tools.invoke([
+            model.invoke([
                 {"role": "system", "content": system_prompt}
             ] + state["messages"])
         ]
     }
 
 
+def _accept(state, tool_call, response, result, memory_updates):
+    """Execute the tool with its original arguments."""
+    observation = _INVOKERS[tool_call["name"]](tool_call["args"])
+    result.append({
+        "role": "tool", 
+        "content": str(observation), 
+        "tool_call_id": tool_call["id"]
+    })
+
+
+def _apply_edit(state, tool_call, edited_args, result):
+    """Execute the tool with edited arguments and rewrite the AI message's tool call to match."""
+    # Update the AI message's tool call with edited content (reference to the message in the state)
+    ai_message = state["messages"][-1]  # Get the most recent message from the state
+    current_id = tool_call["id"]  # Store the ID of the tool call being edited
+    
+    # Create a copy of the tool calls with the edited one swapped in place
+    # This avoids modifying the original list directly (immutable approach)
+    updated_tool_calls = list(ai_message.tool_calls)
+    index = next(i for i, tc in enumerate(updated_tool_calls) if tc["id"] == current_id)
+    updated_tool_calls[index] = {"type": "tool_call", "name": tool_call["name"], "args": edited_args, "id": current_id}
+    
+    # Create a new copy of the message with updated tool calls rather than modifying the original
+    # This ensures state immutability and prevents side effects in other parts of the code
+    # When we update the messages state key ("messages": result), the add_messages reducer will
+    # overwrite existing messages by id and we take advantage of this here to update the tool calls.
+    result.append(ai_message.model_copy(update={"tool_calls": updated_tool_calls}))
+
+    # Execute the tool with edited args
+    observation = _INVOKERS[tool_call["name"]](edited_args)
+    # Add only the tool response message
+    result.append({"role": "tool", "content": observation, "tool_call_id": current_id})
+
+
+def _edit_email(state, tool_call, response, result, memory_updates):
+    """Send the email as edited in Agent Inbox and learn from the edit."""
+    edited_args = response["args"]["args"]
+    _apply_edit(state, tool_call, edited_args, result)
+    # Queue memory update with feedback
+    memory_updates.append(memory_update(("email_assistant", "response_preferences"), [{
+        "role": "user",
+        "content": f"User edited the email response. Here is the initial email generated by the assistant: {tool_call['args']}. Here is the edited email: {edited_args}. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
+    }]))
+
+
+def _edit_meeting(state, tool_call, response, result, memory_updates):
+    """Schedule the meeting as edited in Agent Inbox and learn from the edit."""
+    edited_args = response["args"]["args"]
+    _apply_edit(state, tool_call, edited_args, result)
+    # Queue memory update with feedback
+    memory_updates.append(memory_update(("email_assistant", "cal_preferences"), [{
+        "role": "user",
+        "content": f"User edited the calendar invitation. Here is the initial calendar invitation generated by the assistant: {tool_call['args']}. Here is the edited calendar invitation: {edited_args}. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
+    }]))
+
+
+# (tool response, memory update feedback) for each HITL tool the user can ignore
+_IGNORE_STRINGS = {
+    "write_email": (
+        "User ignored this email draft. Ignore this email and end the workflow.",
+        "The user ignored the email draft. That means they did not want to respond to the email. Update the triage preferences to ensure emails of this type are not classified as respond.",
+    ),
+    "schedule_meeting": (
+        "User ignored this calendar meeting draft. Ignore this email and end the workflow.",
+        "The user ignored the calendar meeting draft. That means they did not want to schedule a meeting for this email. Update the triage preferences to ensure emails of this type are not classified as respond.",
+    ),
+    "Question": (
+        "User ignored this question. Ignore this email and end the workflow.",
+        "The user ignored the Question. That means they did not want to answer the question or deal with this email. Update the triage preferences to ensure emails of this type are not classified as respond.",
+    ),
+}
+
+
+def _ignore(state, tool_call, response, result, memory_updates):
+    """Skip the tool, end the workflow and update triage preferences."""
+    tool_message, memory_message = _IGNORE_STRINGS[tool_call["name"]]
+    # Don't execute the tool, and tell the agent how to proceed
+    result.append({"role": "tool", "content": tool_message, "tool_call_id": tool_call["id"]})
+    # Queue memory update
+    memory_updates.append(memory_update(("email_assistant", "triage_preferences"), _chain(state["messages"], result, [{
+        "role": "user",
+        "content": f"{memory_message} Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
+    }])))
+    # Go to END
+    return END
+
+
+def _feedback(state, tool_call, response, result, memory_updates, *, tool_message, namespace=None, memory_message=None):
+    """Skip the tool and pass the user's feedback back to the agent."""
+    # Don't execute the tool, and add a message with the user feedback
+    result.append({"role": "tool", "content": f"{tool_message} Feedback: {response['args']}", "tool_call_id": tool_call["id"]})
+    # Queue memory update
+    if namespace:
+        memory_updates.append(memory_update(namespace, _chain(state["messages"], result, [{
+            "role": "user",
+            "content": f"{memory_message} Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
+        }])))
+
+
+# Handlers for human responses to HITL tool calls, keyed by (response type, tool name).
+# A handler appends tool messages to result, queues memory updates and may return END
+# to stop the workflow.
+_RESPONSE_HANDLERS = {
+    ("accept", "write_email"): _accept,
+    ("accept", "schedule_meeting"): _accept,
+    ("accept", "Question"): _accept,
+    ("edit", "write_email"): _edit_email,
+    ("edit", "schedule_meeting"): _edit_meeting,
+    ("ignore", "write_email"): _ignore,
+    ("ignore", "schedule_meeting"): _ignore,
+    ("ignore", "Question"): _ignore,
+    ("response", "write_email"): partial(
+        _feedback,
+        tool_message="User gave feedback, which can we incorporate into the email.",
+        namespace=("email_assistant", "response_preferences"),
+        memory_message="User gave feedback, which we can use to update the response preferences.",
+    ),
+    ("response", "schedule_meeting"): partial(
+        _feedback,
+        tool_message="User gave feedback, which can we incorporate into the meeting request.",
+        namespace=("email_assistant", "cal_preferences"),
+        memory_message="User gave feedback, which we can use to update the calendar preferences.",
+    ),
+    ("response", "Question"): partial(
+        _feedback,
+        tool_message="User answered the question, which can we can use for any follow up actions.",
+    ),
+}
+
+
 def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_call", "__end__"]]:
     """Core HITL component: Handle human review of tool calls.
     
@@ -285,67 +696,46 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
     """
     
     result = []
+    memory_updates = []  # Memory updates to apply once the run ends
     goto = "llm_call"  # Default: continue to LLM after processing
+    tool_calls = state["messages"][-1].tool_calls
+
+    # Auto-execute non-HITL tools up front; they don't depend on each other,
+    # so several of them run concurrently
+    auto_calls = [tc for tc in tool_calls if tc["name"] not in _HITL_TOOLS]
+    if len(auto_calls) > 1:
+        observations = list(_TOOL_EXECUTOR.map(lambda tc: _INVOKERS[tc["name"]](tc["args"]), auto_calls))
+    else:
+        observations = [_INVOKERS[tc["name"]](tc["args"]) for tc in auto_calls]
+    auto_observations = {tc["id"]: observation for tc, observation in zip(auto_calls, observations)}
 
     # Process each tool call from the LLM
-    for tool_call in state["messages"][-1].tool_calls:
-        
-        # Define which tools require human approval
-        hitl_tools = ["write_email", "schedule_meeting", "Question"]
+    for tool_call in tool_calls:
         
-        # Auto-execute non-HITL tools without interruption
-        if tool_call["name"] not in hitl_tools:
-            tool = tools_by_name[tool_call["name"]]
-            observation = tool.invoke(tool_call["args"])
+        # Non-HITL tools already ran without interruption
+        if tool_call["name"] not in _HITL_TOOLS:
             result.append({
                 "role": "tool", 
-                "content": str(observation), 
+                "content": str(auto_observations[tool_call["id"]]), 
                 "tool_call_id": tool_call["id"]
             })
             continue
             
         # HITL tools require human review
         # Get original email context for display
-        email_input = state["email_input"]
-        author, to, subject, email_thread = parse_email(email_input)
-        original_email_markdown = format_email_markdown(subject, author, to, email_thread)
+        original_email_markdown = state["email_markdown"]
         
         # Format tool call for clear display in Agent Frontend UI
         tool_display = format_for_display(tool_call)
         description = original_email_markdown + tool_display
 
-        # Configure allowed actions based on tool type
-        if tool_call["name"] == "write_email":
-            config = {
-                "allow_ignore": True,    # User can cancel email
-                "allow_respond": True,   # User can provide feedback
-                "allow_edit": True,      # User can edit email content
-                "allow_accept": True,    # User can approve as-is
-            }
-        elif tool_call["name"] == "schedule_meeting":
-            config = {
-                "allow_ignore": True,    # User can cancel meeting
-                "allow_respond": True,   # User can provide feedback
-                "allow_edit": True,      # User can edit meeting details
-                "allow_accept": True,    # User can approve as-is
-            }
-        elif tool_call["name"] == "Question":
-            config = {
-                "allow_ignore": True,    # User can skip question
-                "allow_respond": True,   # User can answer question
-                "allow_edit": False,     # Questions can't be edited
-                "allow_accept": False,   # Questions need answers, not acceptance
-            }
-        else:
-            raise ValueError(f"Unexpected HITL tool: {tool_call['name']}")
-
-        # Create interrupt request
+        # Create interrupt request with the allowed actions for this tool type
         request = {
             "action_request": {
                 "action": tool_call["name"],
                 "args": tool_call["args"]
             },
-            "config": config,
+            "config": _CFG_BY_TOOL[tool_call["name"]],
             "description": description,
         }
 
@@ -353,147 +743,55 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
         response = interrupt([request])[0]
 
         # Process human response
-        if response["type"] == "accept":
-            # Execute tool with original arguments
-            tool = tools_by_name[tool_call["name"]]
-            observation = tool.invoke(tool_call["args"])
-            result.append({
-                "role": "tool", 
-                "content": str(observation), 
-                "tool_call_id": tool_call["id"]
-            })
-                        
-        elif response["type"] == "edit":
-            # Execute tool with edited arguments
-            tool = tools_by_name[tool_call["name"]]
-            edited_args = response["args"]["args"]
-
-            # Update the AI message's tool call with edited content (reference to the message in the state)
-            ai_message = state["messages"][-1]  # Get the most recent message from the state
-            current_id = tool_call["id"]  # Store the ID of the tool call being edited
-            
-            # Create a new list of tool calls by filtering out the one being edited and adding the updated version
-            # This avoids modifying the original list directly (immutable approach)
-            updated_tool_calls = [tc for tc in ai_message.tool_calls if tc["id"] != current_id] + [
-                {"type": "tool_call", "name": tool_call["name"], "args": edited_args, "id": current_id}
-            ]
-            
-            # Create a new copy of the message with updated tool calls rather than modifying the original
-            # This ensures state immutability and prevents side effects in other parts of the code
-            # When we update the messages state key ("messages": result), the add_messages reducer will
-            # overwrite existing messages by id and we take advantage of this here to update the tool calls.
-            result.append(ai_message.model_copy(update={"tool_calls": updated_tool_calls}))
-
-            # Update the write_email tool call with the edited content from Agent Inbox
-            if tool_call["name"] == "write_email":
-                # Store initial tool call for memory update
-                initial_tool_call = tool_call["args"]
-                # Execute the tool with edited args
-                observation = tool.invoke(edited_args)
-                # Add only the tool response message
-                result.append({"role": "tool", "content": observation, "tool_call_id": current_id})
-                # Update memory with feedback
-                update_memory(store, ("email_assistant", "response_preferences"), [{
-                    "role": "user",
-                    "content": f"User edited the email response. Here is the initial email generated by the assistant: {initial_tool_call}. Here is the edited email: {edited_args}. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
-            
-            # Update the schedule_meeting tool call with the edited content from Agent Inbox
-            elif tool_call["name"] == "schedule_meeting":
-                # Store initial tool call for memory update
-                initial_tool_call = tool_call["args"]
-                # Execute the tool with edited args
-                observation = tool.invoke(edited_args)
-                # Add only the tool response message
-                result.append({"role": "tool", "content": observation, "tool_call_id": current_id})
-                # Update memory with feedback
-                update_memory(store, ("email_assistant", "cal_preferences"), [{
-                    "role": "user",
-                    "content": f"User edited the calendar invitation. Here is the initial calendar invitation generated by the assistant: {initial_tool_call}. Here is the edited calendar invitation: {edited_args}. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
-            
-            # Catch all other tool calls
-            else:
-                raise ValueError(f"Invalid tool call: {tool_call['name']}")
-
-        elif response["type"] == "ignore":
-            if tool_call["name"] == "write_email":
-                # Don't execute the tool, and tell the agent how to proceed
-                result.append({"role": "tool", "content": "User ignored this email draft. Ignore this email and end the workflow.", "tool_call_id": tool_call["id"]})
-                # Go to END
-                goto = END
-                # Update memory
-                update_memory(store, ("email_assistant", "triage_preferences"), state["messages"] + result + [{
-                    "role": "user",
-                    "content": f"The user ignored the email draft. That means they did not want to respond to the email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
-            elif tool_call["name"] == "schedule_meeting":
-                # Don't execute the tool, and tell the agent how to proceed
-                result.append({"role": "tool", "content": "User ignored this calendar meeting draft. Ignore this email and end the workflow.", "tool_call_id": tool_call["id"]})
-                # Go to END
-                goto = END
-                # Update memory
-                update_memory(store, ("email_assistant", "triage_preferences"), state["messages"] + result + [{
-                    "role": "user",
-                    "content": f"The user ignored the calendar meeting draft. That means they did not want to schedule a meeting for this email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
-            elif tool_call["name"] == "Question":
-                # Don't execute the tool, and tell the agent how to proceed
-                result.append({"role": "tool", "content": "User ignored this question. Ignore this email and end the workflow.", "tool_call_id": tool_call["id"]})
-                # Go to END
-                goto = END
-                # Update memory
-                update_memory(store, ("email_assistant", "triage_preferences"), state["messages"] + result + [{
-                    "role": "user",
-                    "content": f"The user ignored the Question. That means they did not want to answer the question or deal with this email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
-            else:
-                raise ValueError(f"Invalid tool call: {tool_call['name']}")
-            
-        elif response["type"] == "response":
-            # User provided feedback
-            user_feedback = response["args"]
-            if tool_call["name"] == "write_email":
-                # Don't execute the tool, and add a message with the user feedback to incorporate into the email
-                result.append({"role": "tool", "content": f"User gave feedback, which can we incorporate into the email. Feedback: {user_feedback}", "tool_call_id": tool_call["id"]})
-                # Update memory
-                update_memory(store, ("email_assistant", "response_preferences"), state["messages"] + result + [{
-                    "role": "user",
-                    "content": f"User gave feedback, which we can use to update the response preferences. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
-            elif tool_call["name"] == "schedule_meeting":
-                # Don't execute the tool, and add a message with the user feedback to incorporate into the meeting request
-                result.append({"role": "tool", "content": f"User gave feedback, which can we incorporate into the meeting request. Feedback: {user_feedback}", "tool_call_id": tool_call["id"]})
-                # Update memory
-                update_memory(store, ("email_assistant", "cal_preferences"), state["messages"] + result + [{
-                    "role": "user",
-                    "content": f"User gave feedback, which we can use to update the calendar preferences. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
-            elif tool_call["name"] == "Question": 
-                # Don't execute the tool, and add a message with the user feedback to incorporate into the email
-                result.append({"role": "tool", "content": f"User answered the question, which can we can use for any follow up actions. Feedback: {user_feedback}", "tool_call_id": tool_call["id"]})
-            else:
-                raise ValueError(f"Invalid tool call: {tool_call['name']}")
-
-        else:
-            raise ValueError(f"Invalid response type: {response}")
+        handler = _RESPONSE_HANDLERS.get((response["type"], tool_call["name"]))
+        if handler is None:
+            raise ValueError(f"Invalid response type {response['type']!r} for tool call: {tool_call['name']}")
+        goto = handler(state, tool_call, response, result, memory_updates) or goto
             
-    # Update state with processed messages
+    # Update state with processed messages and queued memory updates
     update = {"messages": result}
+    if memory_updates:
+        update["pending_memory_updates"] = memory_updates
     return Command(goto=goto, update=update)
 
 
+def apply_memory_updates(store, updates):
+    """Apply queued memory updates, fusing several into one LLM call."""
+    try:
+        if len(updates) == 1:
+            update_memory(store, tuple(updates[0]["namespace"]), updates[0]["messages"])
+        else:
+            update_memories(store, updates)
+    except Exception:
+        logger.exception("Failed to apply %d memory update(s)", len(updates))
+    finally:
+        # Drop cached profiles even if an update failed half-way through
+        cache = _mem_cache(store)
+        for update in updates:
+            cache.pop(tuple(update["namespace"]))
+
+
+def flush_memory(state: State, store: BaseStore):
+    """Hand the memory updates queued during the run to the background worker."""
+    updates = state.get("pending_memory_updates")
+    if not updates:
+        return {}
+
+    # Preferences are only read when the next email is processed, so the run
+    # doesn't wait for the memory LLM call
+    _MEM_EXECUTOR.submit(apply_memory_updates, store, updates)
+
+    # Clear the queue
+    return {"pending_memory_updates": None}
+
+
 def should_continue(state: State, store: BaseStore) -> Literal["interrupt_handler", "__end__"]:
     """Route to tool handler, or end if Done tool called"""
-    messages = state["messages"]
-    last_message = messages[-1]
-    if last_message.tool_calls:
-        for tool_call in last_message.tool_calls: 
-            if tool_call["name"] == "Done":
-                return END
-            else:
-                return "interrupt_handler"
-    return END
+    last_message = state["messages"][-1]
+    names = {tool_call["name"] for tool_call in last_message.tool_calls}
+    if not names or "Done" in names:
+        return END
+    return "interrupt_handler"
 
 
 # Build the HITL response agent (subgraph for tool-calling with human oversight)
@@ -520,29 +818,101 @@ email_assistant_hitl = StateGraph(State, input=StateInput)
 email_assistant_hitl.add_node("triage_router", triage_router)
 email_assistant_hitl.add_node("triage_interrupt_handler", triage_interrupt_handler)
 email_assistant_hitl.add_node("response_agent", compiled_response_agent)
+email_assistant_hitl.add_node("flush_memory", flush_memory)
 
 email_assistant_hitl.add_edge(START, "triage_router")
+email_assistant_hitl.add_edge("response_agent", "flush_memory")
+email_assistant_hitl.add_edge("flush_memory", END)
 # Note: triage_router uses Command for conditional routing
 
-# def get_compiled_email_assistant_hitl():
-#     """Get compiled HITL email assistant with Redis context management.
+# In-memory compiled HITL graph, built lazily on first use
+_COMPILED = None
+_LOCK = threading.Lock()
+# Redis-backed graph while open_email_assistant_hitl is active
+_OPENED = None
+checkpointer = None
+store = None
+
+
+def _use_redis() -> bool:
+    return os.getenv("HITL_PERSISTENCE", "memory").lower() == "redis"
+
+
+def get_compiled_email_assistant_hitl():
+    """Get the in-memory compiled HITL email assistant, building it on first call.
+    
+    This graph always keeps its checkpoints and memory in process memory and
+    supports both the sync and async APIs. Servers should use
+    aget_compiled_email_assistant_hitl, which returns the Redis-backed graph
+    when HITL_PERSISTENCE=redis.
     
-#     This function uses proper context managers for Redis components as recommended
-#     in the LangGraph documentation for memory persistence.
+    Returns:
+        Compiled StateGraph with store and checkpointer
+    """
+    global _COMPILED, checkpointer, store
+    if _COMPILED is None:
+        with _LOCK:
+            if _COMPILED is None:
+                checkpointer = InMemorySaver()
+                store = InMemoryStore()
+                _COMPILED = email_assistant_hitl.compile(checkpointer=checkpointer, store=store)
+    return _COMPILED
+
+
+@asynccontextmanager
+async def open_email_assistant_hitl():
+    """Open the HITL graph's persistence for the lifetime of an application.
     
-#     Returns:
-#         Compiled StateGraph with Redis store and checkpointer
-#     """
-#     # Get Redis URL from environment variable, fallback to localhost for development
-#     redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+    With HITL_PERSISTENCE=redis, connects to Redis at REDIS_URL (a Redis Stack
+    server with RediSearch), creates the store and checkpointer indexes, and
+    yields the Redis-backed graph. On exit it waits for queued memory updates
+    and closes both connections. Otherwise yields the in-memory graph.
     
-#     with RedisStore.from_conn_string(redis_url) as store, \
-#          RedisSaver.from_conn_string(redis_url) as checkpointer:
-#         store.setup()
-#         checkpointer.setup()
-#         return email_assistant_hitl.compile(checkpointer=checkpointer, store=store)
-
-# For backward compatibility, provide the compiled agent directly
-checkpointer = InMemorySaver()
-store = InMemoryStore()
-compiled_email_assistant_hitl = email_assistant_hitl.compile(checkpointer=checkpointer, store=store)
\ No newline at end of file
+    The Redis checkpointer is async, so the Redis-backed graph must be driven
+    with the async API (astream/ainvoke/aget_state). Nodes stay sync and run in
+    worker threads, so the store is the sync RedisStore.
+    """
+    global _OPENED
+    if not _use_redis():
+        yield get_compiled_email_assistant_hitl()
+        return
+    
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url:
+        raise RuntimeError("HITL_PERSISTENCE=redis requires REDIS_URL to be set")
+    
+    async with AsyncExitStack() as stack:
+        redis_store = stack.enter_context(RedisStore.from_conn_string(redis_url))
+        await asyncio.to_thread(redis_store.setup)
+        redis_saver = await stack.enter_async_context(AsyncRedisSaver.from_conn_string(redis_url))
+        _OPENED = email_assistant_hitl.compile(checkpointer=redis_saver, store=redis_store)
+        try:
+            yield _OPENED
+        finally:
+            _OPENED = None
+            # The memory worker runs one update at a time, so this waits for all queued ones
+            await asyncio.to_thread(_MEM_EXECUTOR.submit(lambda: None).result)
+
+
+async def aget_compiled_email_assistant_hitl():
+    """Get the compiled HITL email assistant from async code.
+    
+    Returns the graph opened by open_email_assistant_hitl, or the in-memory
+    graph when Redis persistence is not enabled.
+    
+    Returns:
+        Compiled StateGraph with store and checkpointer
+    """
+    if _OPENED is not None:
+        return _OPENED
+    if _use_redis():
+        raise RuntimeError("Redis HITL persistence is only available inside open_email_assistant_hitl()")
+    return get_compiled_email_assistant_hitl()
+
+
+def __getattr__(name):
+    # For backward compatibility, keep compiled_email_assistant_hitl importable.
+    # It is always the in-memory graph.
+    if name == "compiled_email_assistant_hitl":
+        return get_compiled_email_assistant_hitl()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,7 +2,6 @@
 
 from datetime import datetime
 from langchain_core.tools import tool
-from pydantic import BaseModel
 
 @tool
 def write_email(to: str, subject: str, content: str) -> str:
@@ -33,12 +32,16 @@ def schedule_meeting(
     return f"📅 Meeting '{subject}' scheduled on {date_str} at {start_time}:00"
 
 @tool
-class Done(BaseModel):
+def Done() -> str:
     """Mark that the email processing is complete."""
-    done: bool = True
+    return "done"
 
 
 # Export tools list
+# Tools act on the fully-formed arguments the agent already generated and never
+# call an LLM themselves. Keep it that way for new tools: memory/RAG backed tools
+# should store content as given (e.g. mem0 `infer=False`) instead of running a
+# second LLM pass per tool call.
 TOOLS = [
     write_email,
     check_calendar_availability,
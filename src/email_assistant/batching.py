@@ -0,0 +1,85 @@
+"""Micro-batching for blocking calls made from many threads at once.
+
+Callers submit one item each and block until its result is ready. A
+background thread collects items until the batch is full or the oldest item
+has waited ``max_wait`` seconds, then hands the whole batch to a single
+function call.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
+
+
+class MicroBatcher:
+    """Group concurrent ``submit`` calls into batches for ``batch_fn``.
+
+    ``batch_fn`` receives a list of items and must return one result per item,
+    in order. A failing batch raises the same exception in every caller, and so
+    does a batch whose result count doesn't match its item count.
+
+    ``submit`` blocks its thread until the batch is done, so call it from sync
+    code (e.g. sync graph nodes, which LangGraph runs in worker threads), never
+    from a coroutine running on an event loop.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 6,
+        max_wait: float = 0.05,
+        max_concurrent_batches: int = 4,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix="micro-batch")
+        self._worker: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, item: Any) -> Any:
+        """Queue an item and block until its batch has been processed."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("MicroBatcher.submit blocks; call it from a worker thread, not an event loop")
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._collect, name="micro-batch-collector", daemon=True)
+                    self._worker.start()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _collect(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch: List[Tuple[Any, Future]]) -> None:
+        try:
+            results = list(self.batch_fn([item for item, _ in batch]))
+            if len(results) != len(batch):
+                raise ValueError(f"batch_fn returned {len(results)} results for {len(batch)} items")
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,70 @@
+"""Shared HTTP clients for model provider calls.
+
+Every chat model in the process is built on these clients, so concurrent LLM
+calls multiplex over one pool of kept-alive HTTP/2 connections instead of
+paying a TLS handshake per connection.
+
+Async connections belong to the event loop that opened them, so the async
+client keeps one pool per running loop. Code that calls ``asyncio.run`` more
+than once (sync wrappers, evaluation scripts, per-test loops) then never
+reuses a connection from a closed loop. Each pool is closed when its loop
+shuts down its async generators, which ``asyncio.run`` and uvicorn do on exit.
+"""
+
+import asyncio
+import weakref
+from typing import AsyncIterator
+
+import httpx
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+
+class _NoTransport(httpx.AsyncBaseTransport):
+    """Placeholder transport for the client that only dispatches to per-loop clients."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        raise RuntimeError("LoopLocalAsyncClient sends through its per-loop clients")
+
+
+async def _closed_on_loop_shutdown(client: httpx.AsyncClient) -> AsyncIterator[None]:
+    # A started async generator is finalized by loop.shutdown_asyncgens(),
+    # which closes the client from inside the loop that owns its connections
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+class LoopLocalAsyncClient(DefaultAsyncHttpxClient):
+    """Async client that sends each request through a pool owned by the running loop."""
+
+    def __init__(self, **kwargs):
+        super().__init__(transport=_NoTransport(), **kwargs)
+        self._client_kwargs = kwargs
+        # Per-loop client and the generator that closes it at loop shutdown
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        loop = asyncio.get_running_loop()
+        entry = self._loop_clients.get(loop)
+        if entry is None:
+            client = DefaultAsyncHttpxClient(**self._client_kwargs)
+            closer = _closed_on_loop_shutdown(client)
+            await closer.__anext__()
+            entry = self._loop_clients[loop] = (client, closer)
+        return await entry[0].send(request, **kwargs)
+
+    async def aclose(self) -> None:
+        """Close the running loop's pool; pools of other loops close when their loop shuts down."""
+        entry = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[1].aclose()
+        await super().aclose()
+
+
+http_client = DefaultHttpxClient(http2=True, limits=HTTP_LIMITS)
+http_async_client = LoopLocalAsyncClient(http2=True, limits=HTTP_LIMITS)
@@ -0,0 +1,39 @@
+"""Rule-based pre-classifier that triages obvious emails without an LLM call.
+
+Rules only fire when the decision is unambiguous under
+DEFAULT_TRIAGE_INSTRUCTIONS, which is what the non-HITL agent triages with;
+everything else returns None and goes through the LLM router as usual. Sender
+or footer heuristics (e.g. "notifications@" plus an unsubscribe link) are left
+to the LLM, since the same shape covers both ignored promotions and GitHub
+notifications the user wants to hear about.
+"""
+
+import re
+from collections import Counter
+from typing import Literal, Optional, Tuple
+
+_AUTO_REPLY_SUBJECT_RE = re.compile(r"^\s*(automatic reply|auto-?reply|out of (the )?office)\b", re.I)
+
+# Hit/miss counters so the pre-classifier's hit-rate can be monitored
+fast_triage_stats: Counter = Counter()
+
+
+def fast_triage(author: str, subject: str, email_thread: str) -> Optional[Tuple[Literal["ignore", "notify"], str]]:
+    """Classify trivially triageable emails.
+
+    Args:
+        author: Email sender, e.g. "Alice <alice@company.com>"
+        subject: Email subject
+        email_thread: Email content
+
+    Returns:
+        Tuple of (classification, reason) when a rule matches, otherwise None
+    """
+    if _AUTO_REPLY_SUBJECT_RE.search(subject):
+        # Auto-replies are mostly out-of-office notices ("team member on vacation" -> notify)
+        decision = ("notify", "Automatic reply / out of office message")
+    else:
+        decision = None
+
+    fast_triage_stats["hit" if decision else "miss"] += 1
+    return decision
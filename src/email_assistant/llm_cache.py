@@ -0,0 +1,217 @@
+"""Response caches for LLM calls.
+
+Calls made with ``temperature == 0`` return the same output for the same
+input, so their results can be reused instead of paying for another round
+trip. Entries live in an in-process LRU and, when a Redis URL is configured,
+in Redis so that every worker process shares them.
+
+``SemanticCache`` extends this to near-duplicate inputs by matching on
+embedding similarity instead of an exact key.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import BaseMessage, convert_to_openai_messages
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+
+
+def cache_key(
+    model: str,
+    messages: Iterable[Any],
+    temperature: float,
+    tools: Optional[Iterable[str]] = None,
+    response_format: Optional[str] = None,
+) -> str:
+    """Build a stable cache key for an LLM request.
+
+    Args:
+        model: Model identifier, e.g. "openai:gpt-4.1"
+        messages: Prompt messages (dicts or LangChain message objects)
+        temperature: Sampling temperature of the model
+        tools: Names of the tools bound to the model, if any
+        response_format: Name of the structured output schema, if any
+
+    Returns:
+        Hex encoded sha256 of the request payload
+    """
+    payload = {
+        "model": model,
+        # OpenAI format drops LangChain's per-run message ids from the key
+        "messages": [
+            convert_to_openai_messages(m) if isinstance(m, BaseMessage) else m
+            for m in messages
+        ],
+        "temperature": temperature,
+        "tools": sorted(tools or []),
+        "response_format": response_format,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with an optional time-to-live."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            stored_at, value = entry
+            if self.ttl is not None and time.monotonic() - stored_at >= self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class LLMCache:
+    """Two-level (memory + optional Redis) cache for JSON-serializable LLM results.
+
+    Redis errors are treated as cache misses so an unavailable cache never
+    fails a request.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: int = 24 * 60 * 60,
+        redis_url: Optional[str] = None,
+        prefix: str = "llm_cache:",
+    ):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.redis_url = redis_url
+        self._memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._redis: Optional[Redis] = None
+        self._aredis: Optional[AsyncRedis] = None
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._memory.get(key)
+        if value is not None or not self.redis_url:
+            return value
+        try:
+            if self._redis is None:
+                self._redis = Redis.from_url(self.redis_url)
+            raw = self._redis.get(self.prefix + key)
+        except RedisError:
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self._memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._memory.set(key, value)
+        if not self.redis_url:
+            return
+        try:
+            if self._redis is None:
+                self._redis = Redis.from_url(self.redis_url)
+            self._redis.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+        except RedisError:
+            pass
+
+    async def aget(self, key: str) -> Optional[Any]:
+        value = self._memory.get(key)
+        if value is not None or not self.redis_url:
+            return value
+        try:
+            if self._aredis is None:
+                self._aredis = AsyncRedis.from_url(self.redis_url)
+            raw = await self._aredis.get(self.prefix + key)
+        except RedisError:
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self._memory.set(key, value)
+        return value
+
+    async def aset(self, key: str, value: Any) -> None:
+        self._memory.set(key, value)
+        if not self.redis_url:
+            return
+        try:
+            if self._aredis is None:
+                self._aredis = AsyncRedis.from_url(self.redis_url)
+            await self._aredis.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+        except RedisError:
+            pass
+
+
+class SemanticCache:
+    """In-process cache that matches queries by embedding cosine similarity.
+
+    Keep one instance per output vocabulary (e.g. triage labels) so results
+    from unrelated prompts never match each other. Entries stored under a
+    partition (e.g. an email's sender) only match lookups for that partition.
+    """
+
+    def __init__(self, embeddings: Embeddings, threshold: float = 0.92, maxsize: int = 1024):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._vectors: list[np.ndarray] = []
+        self._values: list[Any] = []
+        self._partitions: list[Optional[str]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._partition_array: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    async def aembed(self, query: str) -> np.ndarray:
+        """Embed a query as a unit-length vector."""
+        vector = np.asarray(await self.embeddings.aembed_query(query), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, vector: np.ndarray, partition: Optional[str] = None) -> Optional[Any]:
+        """Return the value of the most similar entry in the partition above the threshold."""
+        with self._lock:
+            if not self._vectors:
+                return None
+            if self._matrix is None:
+                self._matrix = np.vstack(self._vectors)
+                self._partition_array = np.array(self._partitions, dtype=object)
+            scores = np.where(self._partition_array == partition, self._matrix @ vector, -np.inf)
+            best = int(np.argmax(scores))
+            return self._values[best] if scores[best] >= self.threshold else None
+
+    def put(self, vector: np.ndarray, value: Any, partition: Optional[str] = None) -> None:
+        """Store a value under an embedded query, evicting the oldest entry when full."""
+        with self._lock:
+            if len(self._vectors) >= self.maxsize:
+                del self._vectors[0], self._values[0], self._partitions[0]
+            self._vectors.append(vector)
+            self._values.append(value)
+            self._partitions.append(partition)
+            self._matrix = None
@@ -1,30 +1,50 @@
-from fastapi import FastAPI, HTTPException
-from typing import Dict, Any
-import uuid
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, AsyncIterator, Union
+import orjson
+import re
+import secrets
+import weakref
 import uvicorn
 from .schemas import (
     ProcessEmailRequest, ProcessEmailResponse, EmailInput,
-    ProcessEmailHITLRequest, ProcessEmailHITLResponse, InterruptInfo
+    ProcessEmailBatchRequest, ProcessEmailBatchResponse, ProcessEmailBatchItem,
+    ProcessEmailHITLRequest, ProcessEmailHITLResponse, InterruptInfo, HumanResponse
 )
-from .agent import process_email
+from .agent import EmailIdConflictError, aprocess_email
+import asyncio
+from langchain_core.messages import ToolMessage
 from langgraph.types import Command
-from .agent_hitl import compiled_email_assistant_hitl
+from .agent_hitl import aget_compiled_email_assistant_hitl, open_email_assistant_hitl
+from contextlib import asynccontextmanager
+from .llm_cache import LRUCache
 import os
 
+# Write each HITL checkpoint before starting the next step. With the default
+# "async" durability, pending checkpoint writes chain up per superstep and keep
+# checkpoint state alive; HITL runs are short, so the extra wait is negligible.
+HITL_DURABILITY = "sync"
+
+
+# Interrupt config flag -> action name, in the order actions are reported
+_ACTION_KEYS = (
+    ("allow_accept", "accept"),
+    ("allow_edit", "edit"),
+    ("allow_ignore", "ignore"),
+    ("allow_respond", "respond"),
+)
+
 
 def _get_allowed_actions(config: Dict[str, bool]) -> list[str]:
     """Extract allowed actions from interrupt config."""
-    actions = []
-    if config.get("allow_accept", False):
-        actions.append("accept")
-    if config.get("allow_edit", False):
-        actions.append("edit")
-    if config.get("allow_ignore", False):
-        actions.append("ignore")
-    if config.get("allow_respond", False):
-        actions.append("respond")
-    return actions
+    return [action for key, action in _ACTION_KEYS if config.get(key)]
  
+# Tool results that carry the final answer of a workflow
+# (write_email: "Email sent to ...", schedule_meeting: "Meeting '<subject>' scheduled on ...")
+_TOOL_RESULT_RE = re.compile(r"Email sent|Meeting '.*' scheduled")
+
+
 def _extract_final_result(state: Dict[str, Any]) -> ProcessEmailResponse:
     """Extract final result from completed workflow state."""
     # Extract classification from state
@@ -37,11 +57,12 @@ def _extract_final_result(state: Dict[str, Any]) -> ProcessEmailResponse:
     # Look for the last tool execution result in messages
     messages = state.get("messages", [])
     
-    # Find the most recent ToolMessage using Python best practices
-    for message in reversed(messages):
-        if getattr(message, 'tool_call_id', None) is not None:
+    # Find the most recent ToolMessage reporting a sent email or scheduled meeting
+    for i in range(len(messages) - 1, -1, -1):
+        message = messages[i]
+        if isinstance(message, ToolMessage):
             content = str(message.content)
-            if "Email sent" in content or "Meeting scheduled" in content:
+            if _TOOL_RESULT_RE.search(content):
                 response_text = content
                 break
     
@@ -53,10 +74,20 @@ def _extract_final_result(state: Dict[str, Any]) -> ProcessEmailResponse:
 
 
 # Initialize FastAPI app
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Keep the HITL graph's persistence open while the app is running."""
+    async with open_email_assistant_hitl():
+        yield
+
+
+# Endpoints declare a response model or return type, so FastAPI (>= 0.130)
+# serializes their responses straight to JSON bytes through Pydantic
 app = FastAPI(
     title="Email Assistant API",
     description="A complex email assistant built with LangGraph and FastAPI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 
@@ -67,7 +98,7 @@ async def root() -> Dict[str, str]:
 
 
 @app.post("/process-email", response_model=ProcessEmailResponse)
-def process_email_endpoint(request: ProcessEmailRequest)-> ProcessEmailResponse:
+async def process_email_endpoint(request: ProcessEmailRequest)-> ProcessEmailResponse:
     """
     Process an email through the assistant agent.
     
@@ -75,6 +106,9 @@ def process_email_endpoint(request: ProcessEmailRequest)-> ProcessEmailResponse:
     1. Triage - determines if the email should be ignored, noted, or responded to
     2. Response - if needed, generates an appropriate response
     
+    With an `email_id`, a retry after a failure resumes where the failed run
+    stopped; reusing the id for a different email is rejected with 409.
+    
     Args:
         request: ProcessEmailRequest containing the email data
         
@@ -83,15 +117,10 @@ def process_email_endpoint(request: ProcessEmailRequest)-> ProcessEmailResponse:
     """
     try:
         # Convert Pydantic model to dict for the agent
-        email_dict = {
-            "author": request.email.author,
-            "to": request.email.to,
-            "subject": request.email.subject,
-            "email_thread": request.email.email_thread
-        }
+        email_dict = request.email.model_dump()
 
-        # Process the email through the agent
-        result = process_email(email_dict)
+        # Process the email through the agent without blocking the event loop
+        result = await aprocess_email(email_dict, request.email_id)
 
         return ProcessEmailResponse(
             classification=result["classification"],
@@ -99,6 +128,8 @@ def process_email_endpoint(request: ProcessEmailRequest)-> ProcessEmailResponse:
             reasoning=result["reasoning"]
         )
     
+    except EmailIdConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -106,88 +137,69 @@ def process_email_endpoint(request: ProcessEmailRequest)-> ProcessEmailResponse:
         )
     
 
-@app.post("/process-email-hitl", response_model=ProcessEmailHITLResponse)
-async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest) -> ProcessEmailHITLResponse:
+@app.post("/process-email/batch", response_model=ProcessEmailBatchResponse)
+async def process_email_batch_endpoint(request: ProcessEmailBatchRequest) -> ProcessEmailBatchResponse:
     """
-    Process an email through the HITL (Human-in-the-Loop) workflow.
-    
-    This endpoint supports both starting new HITL workflows and resuming 
-    interrupted ones:
-    
-    **New Workflow:**
-    - Provide `email` data
-    - System generates thread_id and processes until interrupt
+    Process several emails through the assistant agent in one call.
     
-    **Resume Workflow:**
-    - Provide `thread_id` and `human_response`
-    - System resumes from interrupt point
+    Emails run concurrently, each through its own workflow. A failing email
+    doesn't fail the batch: its entry carries an error instead of a result.
     
     Args:
-        request: HITL request with email, thread_id, and/or human_response
+        request: ProcessEmailBatchRequest with up to 100 emails
         
     Returns:
-        HITL response with status, thread_id, and interrupt/result data
+        ProcessEmailBatchResponse with one entry per email, in request order
     """
-    try:        
-        # Determine if this is a new workflow or resume
-        is_resume = request.thread_id is not None and request.human_response is not None
-        is_new = request.email is not None and request.thread_id is None
-        
-        if not is_resume and not is_new:
-            raise HTTPException(
-                status_code=400,
-                detail="Either provide `email` for new workflow or `thread_id` + `human_response` for resume"
-            )
-        
-        # Generate thread config
-        thread_id = request.thread_id if is_resume else str(uuid.uuid4())
-        config = {"configurable": {"thread_id": thread_id}}
-        
-        if is_new:
+    results = await asyncio.gather(
+        *(aprocess_email(email.model_dump()) for email in request.emails),
+        return_exceptions=True,
+    )
+    return ProcessEmailBatchResponse(results=[
+        ProcessEmailBatchItem(error=f"Error processing email: {str(result)}")
+        if isinstance(result, Exception)
+        else ProcessEmailBatchItem(result=ProcessEmailResponse(**result))
+        for result in results
+    ])
+
+
+# One lock per HITL thread, so concurrent resumes of the same thread run one
+# after another instead of racing on its checkpoints. Entries disappear once no
+# request holds them. This only serializes requests within one worker process.
+_thread_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _thread_lock(thread_id: str) -> asyncio.Lock:
+    lock = _thread_locks.get(thread_id)
+    if lock is None:
+        lock = _thread_locks[thread_id] = asyncio.Lock()
+    return lock
+
+
+async def _run_hitl(
+    compiled_email_assistant_hitl,
+    request: ProcessEmailHITLRequest,
+    thread_id: str,
+) -> AsyncIterator[Union[Dict[str, Any], ProcessEmailHITLResponse]]:
+    """Run the HITL workflow until it interrupts or completes.
+    
+    Yields a "started" event once the request has been validated and the
+    thread lock is held, a progress event for every graph update, and always
+    ends with the ProcessEmailHITLResponse describing the interrupt or the
+    completed result.
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    
+    async with _thread_lock(thread_id):
+        if request.thread_id is None:
             # Start new HITL workflow
-            email_dict = {
-                "author": request.email.author,
-                "to": request.email.to,
-                "subject": request.email.subject,
-                "email_thread": request.email.email_thread
-            }
-            
-            # Stream until first interrupt
-            for chunk in compiled_email_assistant_hitl.stream(
-                {"email_input": email_dict}, 
-                config=config
-            ):
-                if "__interrupt__" in chunk:
-                    # Found interrupt - extract details
-                    interrupt_data = chunk["__interrupt__"][0].value[0]
-                    
-                    return ProcessEmailHITLResponse(
-                        status="interrupted",
-                        thread_id=thread_id,
-                        interrupt=InterruptInfo(
-                            action=interrupt_data["action_request"]["action"],
-                            args=interrupt_data["action_request"]["args"],
-                            description=interrupt_data["description"],
-                            allowed_actions=_get_allowed_actions(interrupt_data["config"])
-                        )
-                    )
-                            
-            # No interrupts - workflow completed
-            # Get complete state instead of using streaming chunk
-            complete_state = compiled_email_assistant_hitl.get_state(config)
-            if complete_state and complete_state.values:
-                result = _extract_final_result(complete_state.values)
-                return ProcessEmailHITLResponse(
-                    status="completed",
-                    thread_id=thread_id,
-                    result=result
-                )
+            graph_input = {"email_input": request.email.model_dump()}
         
         else:
             # Resume from interrupt - add better error handling
             try:
                 # Check if thread exists and has a checkpoint
-                state = compiled_email_assistant_hitl.get_state(config)
+                state = await compiled_email_assistant_hitl.aget_state(config)
                 if not state or not state.values:
                     raise HTTPException(
                         status_code=400,
@@ -201,50 +213,148 @@ async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest) -> Proce
                         detail=f"Thread {thread_id} workflow already completed. Cannot resume."
                     )
                 
-                human_response = request.human_response
-                resume_command = Command(resume=[{
-                    "type": human_response.type,
-                    "args": human_response.args or {}
-                }])
-                
-                # Continue from interrupt
-                for chunk in compiled_email_assistant_hitl.stream(
-                    resume_command,
-                    config=config
-                ):
-                    if "__interrupt__" in chunk:
-                        # Another interrupt occurred
-                        interrupt_data = chunk["__interrupt__"][0].value[0]
-                        
-                        return ProcessEmailHITLResponse(
-                            status="interrupted",
-                            thread_id=thread_id,
-                            interrupt=InterruptInfo(
-                                action=interrupt_data["action_request"]["action"],
-                                args=interrupt_data["action_request"]["args"],
-                                description=interrupt_data["description"],
-                                allowed_actions=_get_allowed_actions(interrupt_data["config"])
-                            )
-                        )
-                                    
-                # Workflow completed
-                # Get complete state instead of using streaming chunk
-                complete_state = compiled_email_assistant_hitl.get_state(config)
-                if complete_state and complete_state.values:
-                    result = _extract_final_result(complete_state.values)
-                    return ProcessEmailHITLResponse(
-                        status="completed",
-                        thread_id=thread_id,
-                        result=result
+                # A retried or duplicated resume must not answer a later interrupt
+                if request.interrupt_id is not None and request.interrupt_id not in {
+                    pending.id for pending in state.interrupts
+                }:
+                    raise HTTPException(
+                        status_code=409,
+                        detail=f"Interrupt {request.interrupt_id} of thread {thread_id} was already answered"
                     )
-                    
             except Exception as e:
                 if isinstance(e, HTTPException):
                     raise
                 raise HTTPException(status_code=400, detail=f"Failed to resume thread: {str(e)}")
+                
+            human_response = request.human_response
+            graph_input = Command(resume=[{
+                "type": human_response.type,
+                "args": human_response.args or {}
+            }])
         
-        # Fallback error
-        raise HTTPException(status_code=500, detail="Unexpected workflow state")
+        yield {"event": "started", "thread_id": thread_id}
+        
+        # Track the state through "values" so completion needs no extra checkpoint read
+        final_values = None
+        async for mode, chunk in compiled_email_assistant_hitl.astream(
+            graph_input,
+            config=config,
+            stream_mode=["updates", "values"],
+            durability=HITL_DURABILITY,
+        ):
+            if mode == "values":
+                final_values = chunk
+                continue
+            
+            if "__interrupt__" in chunk:
+                # Found interrupt - extract details
+                pending = chunk["__interrupt__"][0]
+                interrupt_data = pending.value[0]
+                
+                yield ProcessEmailHITLResponse(
+                    status="interrupted",
+                    thread_id=thread_id,
+                    interrupt=InterruptInfo(
+                        action=interrupt_data["action_request"]["action"],
+                        args=interrupt_data["action_request"]["args"],
+                        description=interrupt_data["description"],
+                        allowed_actions=_get_allowed_actions(interrupt_data["config"]),
+                        id=pending.id,
+                    )
+                )
+                return
+            yield {"event": "update", "thread_id": thread_id, "nodes": list(chunk)}
+        
+        # No interrupts - workflow completed
+        if final_values is None:
+            complete_state = await compiled_email_assistant_hitl.aget_state(config)
+            final_values = complete_state.values if complete_state else {}
+        yield ProcessEmailHITLResponse(
+            status="completed",
+            thread_id=thread_id,
+            result=_extract_final_result(final_values)
+        )
+
+
+async def _stream_hitl(started: Dict[str, Any], events: AsyncIterator[Any], thread_id: str) -> AsyncIterator[bytes]:
+    """Encode the already consumed "started" event and the remaining HITL workflow events as NDJSON lines."""
+    try:
+        yield orjson.dumps(started, option=orjson.OPT_APPEND_NEWLINE)
+        async for event in events:
+            if isinstance(event, ProcessEmailHITLResponse):
+                yield event.model_dump_json().encode() + b"\n"
+            else:
+                yield orjson.dumps(event, option=orjson.OPT_APPEND_NEWLINE)
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else f"Error processing HITL email: {str(e)}"
+        yield ProcessEmailHITLResponse(status="error", thread_id=thread_id, error=detail).model_dump_json().encode() + b"\n"
+    finally:
+        await events.aclose()
+
+
+@app.post("/process-email-hitl", response_model=ProcessEmailHITLResponse)
+async def process_email_hitl_endpoint(request: ProcessEmailHITLRequest, stream: bool = False):
+    """
+    Process an email through the HITL (Human-in-the-Loop) workflow.
+    
+    This endpoint supports both starting new HITL workflows and resuming 
+    interrupted ones:
+    
+    **New Workflow:**
+    - Provide `email` data
+    - System generates thread_id and processes until interrupt
+    
+    **Resume Workflow:**
+    - Provide `thread_id` and `human_response`
+    - Optionally provide the answered interrupt's `interrupt_id`; the resume
+      is rejected with 409 once the thread has moved past that interrupt
+    - System resumes from interrupt point
+    
+    Requests for the same thread are handled one at a time.
+    
+    With `?stream=true` the response is NDJSON: a `{"event": "started", ...}`
+    line, one `{"event": "update", ...}` line per graph update as it happens,
+    then a final line with the same HITL response object as the non-streaming
+    call (status `error` on failure).
+    
+    Args:
+        request: HITL request with email, thread_id, and/or human_response
+        stream: Stream progress as NDJSON instead of returning one JSON object
+        
+    Returns:
+        HITL response with status, thread_id, and interrupt/result data
+    """
+    try:        
+        # Determine if this is a new workflow or resume
+        match (request.thread_id, request.human_response, request.email):
+            case (None, _, EmailInput()):
+                is_new = True
+                thread_id = secrets.token_hex(16)
+            case (str() as thread_id, HumanResponse(), _):
+                is_new = False
+            case _:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Either provide `email` for new workflow or `thread_id` + `human_response` for resume"
+                )
+        
+        compiled_email_assistant_hitl = await aget_compiled_email_assistant_hitl()
+        
+        # Validation failures surface here, before any response is started
+        events = _run_hitl(compiled_email_assistant_hitl, request, thread_id)
+        started = await events.__anext__()
+        if stream:
+            return StreamingResponse(_stream_hitl(started, events, thread_id), media_type="application/x-ndjson")
+        
+        # The run always ends with the interrupt or completed response
+        try:
+            async for event in events:
+                pass
+        except Exception as e:
+            if isinstance(e, HTTPException) or is_new:
+                raise
+            raise HTTPException(status_code=400, detail=f"Failed to resume thread: {str(e)}")
+        return event
         
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -260,11 +370,20 @@ async def health_check() -> Dict[str, str]:
     """Health check endpoint."""
     return {"status": "healthy", "service": "email-assistant"}
 
+# Serialized thread state bodies keyed by (thread_id, checkpoint_id). A
+# checkpoint never changes once written, so entries only expire to bound memory.
+_THREAD_STATE_CACHE = LRUCache(maxsize=1024, ttl=60.0)
+
+
 @app.get("/process-email-hitl/{thread_id}")
-async def get_hitl_thread_state(thread_id: str) -> Dict[str, Any]:
+async def get_hitl_thread_state(thread_id: str, http_request: Request) -> Response:
     """
     Get the current state of a HITL thread.
     
+    The response carries the thread's latest checkpoint id as its ETag; polling
+    clients that send it back in `If-None-Match` get `304 Not Modified` until
+    the thread moves on.
+    
     Args:
         thread_id: The thread ID to query
         
@@ -272,8 +391,9 @@ async def get_hitl_thread_state(thread_id: str) -> Dict[str, Any]:
         Current thread state with classification, status, and messages
     """
     try:
+        compiled_email_assistant_hitl = await aget_compiled_email_assistant_hitl()
         config = {"configurable": {"thread_id": thread_id}}
-        state = compiled_email_assistant_hitl.get_state(config)
+        state = await compiled_email_assistant_hitl.aget_state(config)
         
         if not state or not state.values:
             raise HTTPException(
@@ -281,6 +401,16 @@ async def get_hitl_thread_state(thread_id: str) -> Dict[str, Any]:
                 detail=f"Thread {thread_id} not found"
             )
         
+        checkpoint_id = state.config["configurable"]["checkpoint_id"]
+        etag = f'"{checkpoint_id}"'
+        if_none_match = http_request.headers.get("if-none-match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        body = _THREAD_STATE_CACHE.get((thread_id, checkpoint_id))
+        if body is not None:
+            return Response(body, media_type="application/json", headers={"ETag": etag})
+        
         # Extract classification from state
         classification = None
         if "classification_decision" in state.values:
@@ -289,13 +419,15 @@ async def get_hitl_thread_state(thread_id: str) -> Dict[str, Any]:
             if "classification_decision" in state.values["triage_interrupt_handler"]:
                 classification = state.values["triage_interrupt_handler"]["classification_decision"]
         
-        return {
+        body = orjson.dumps(jsonable_encoder({
             "thread_id": thread_id,
             "state": state.values,
             "classification": classification,
             "status": "interrupted" if state.next else "completed",
             "next_nodes": list(state.next) if state.next else []
-        }
+        }))
+        _THREAD_STATE_CACHE.set((thread_id, checkpoint_id), body)
+        return Response(body, media_type="application/json", headers={"ETag": etag})
         
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -309,9 +441,15 @@ async def get_hitl_thread_state(thread_id: str) -> Dict[str, Any]:
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
+    # HITL threads only survive across workers with a shared Redis checkpointer
+    default_workers = (os.cpu_count() or 1) * 2 + 1 if os.getenv("HITL_PERSISTENCE") == "redis" else 1
     uvicorn.run(
         "src.email_assistant.main:app",
         host="0.0.0.0",
         port=port,
-        reload=True
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WORKERS", default_workers)),
+        # Development only; reload runs a single worker
+        reload=os.getenv("RELOAD", "").lower() in ("1", "true"),
     )
\ No newline at end of file
@@ -33,6 +33,12 @@ To: {to}
 Subject: {subject}
 {email_thread}"""
 
+# Email assistant triage user prompt for several emails at once
+TRIAGE_BATCH_USER_PROMPT = """
+Please determine how to handle each of the {count} email threads below.
+Return exactly one classification per email, in the same order as the emails.
+{emails}"""
+
 # Email assistant prompt 
 AGENT_SYSTEM_PROMPT = """
 < Role >
@@ -272,6 +278,31 @@ Think step by step about what specific feedback is being provided and what speci
 
 Think carefully and update the memory profile based upon these user messages:"""
 
+MEMORY_UPDATE_INSTRUCTIONS_MULTI = """
+# Role and Objective
+You are a memory profile manager for an email assistant agent that selectively updates user preferences based on feedback messages from human-in-the-loop interactions with the email assistant.
+You are given several memory profiles at once. Each feedback message is tagged with the profile it applies to.
+
+# Instructions
+- Update each profile ONLY from the feedback tagged for it
+- NEVER overwrite the entire memory profile
+- ONLY make targeted additions of new information
+- ONLY update specific facts that are directly contradicted by feedback messages
+- PRESERVE all other existing information in the profile
+- Format each profile consistently with its original style
+- Generate each profile as a string, and leave profiles that were not provided empty
+
+# Current profiles
+{profiles}
+
+Think step by step about what specific feedback is being provided for each profile and what specific information should be added or updated while preserving everything else.
+
+Think carefully and update the memory profiles based upon these user messages:"""
+
+MEMORY_UPDATE_PROFILE = """<memory_profile name="{name}">
+{current_profile}
+</memory_profile>"""
+
 MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT = """
 Remember:
 - NEVER overwrite the entire memory profile
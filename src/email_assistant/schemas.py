@@ -1,6 +1,6 @@
 """Pydantic models and type definitions for the email assistant."""
 from langgraph.graph import MessagesState
-from typing_extensions import TypedDict, Literal
+from typing_extensions import Annotated, TypedDict, Literal
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, List, Any
 
@@ -27,6 +27,23 @@ class RouterSchema(BaseModel):
     )
 
 
+class BatchRouterSchema(BaseModel):
+    """Schema for triage routing decisions on a batch of emails."""
+    
+    classifications: List[RouterSchema] = Field(
+        description="One routing decision per email, in the same order as the emails."
+    )
+
+
+def merge_memory_updates(left: Optional[List[dict]], right: Optional[List[dict]]) -> List[dict]:
+    """Reducer for queued memory updates: merge entries by id, or clear the queue when given None."""
+    if right is None:
+        return []
+    merged = {update["id"]: update for update in left or []}
+    merged.update((update["id"], update) for update in right)
+    return list(merged.values())
+
+
 class State(MessagesState):
     """State schema for the email assistant agent.
     
@@ -34,6 +51,8 @@ class State(MessagesState):
     """
     email_input: dict
     classification_decision: Literal["ignore", "respond", "notify"]
+    email_markdown: str
+    pending_memory_updates: Annotated[List[dict], merge_memory_updates]
 
 class StateInput(TypedDict):
     # This is the input to the state
@@ -52,6 +71,10 @@ class ProcessEmailRequest(BaseModel):
     """Request schema for processing emails via API."""
     
     email: EmailInput
+    email_id: Optional[str] = Field(
+        default=None,
+        description="Stable id of the email; retrying with the same id resumes a failed run instead of starting over"
+    )
     
 
 class ProcessEmailResponse(BaseModel):
@@ -62,6 +85,40 @@ class ProcessEmailResponse(BaseModel):
     reasoning: str
 
 
+MAX_BATCH_EMAILS = 100
+
+
+class ProcessEmailBatchRequest(BaseModel):
+    """Request schema for processing several emails in one API call."""
+    
+    emails: List[EmailInput] = Field(
+        min_length=1,
+        max_length=MAX_BATCH_EMAILS,
+        description=f"Emails to process (at most {MAX_BATCH_EMAILS})"
+    )
+
+
+class ProcessEmailBatchItem(BaseModel):
+    """Result for one email of a batch; exactly one of result/error is set."""
+    
+    result: Optional[ProcessEmailResponse] = Field(
+        default=None,
+        description="Processing result when the email succeeded"
+    )
+    error: Optional[str] = Field(
+        default=None,
+        description="Error message when the email failed"
+    )
+
+
+class ProcessEmailBatchResponse(BaseModel):
+    """Response schema for batch email processing."""
+    
+    results: List[ProcessEmailBatchItem] = Field(
+        description="One entry per email, in request order"
+    )
+
+
 # HITL-specific schemas
 class HumanResponse(BaseModel):
     """Schema for human responses in HITL workflows."""
@@ -82,6 +139,7 @@ class InterruptInfo(BaseModel):
     args: Dict[str, Any] = Field(description="Original arguments for the action")
     description: str = Field(description="Human-readable description of the action")
     allowed_actions: List[str] = Field(description="List of allowed human response types")
+    id: str = Field(description="ID of this interrupt, sent back as interrupt_id when resuming")
 
 
 class ProcessEmailHITLRequest(BaseModel):
@@ -99,6 +157,10 @@ class ProcessEmailHITLRequest(BaseModel):
         default=None,
         description="Human response to resume from interrupt"
     )
+    interrupt_id: Optional[str] = Field(
+        default=None,
+        description="ID of the interrupt being answered; the resume is rejected if the thread has moved past it"
+    )
 
 
 class ProcessEmailHITLResponse(BaseModel):
@@ -124,4 +186,12 @@ class ProcessEmailHITLResponse(BaseModel):
 class UserPreferences(BaseModel):
     """Updated user preferences based on user's feedback."""
     chain_of_thought: str = Field(description="Reasoning about which user preferences need to add/update if required")
-    user_preferences: str = Field(description="Updated user preferences")
\ No newline at end of file
+    user_preferences: str = Field(description="Updated user preferences")
+
+
+class MultiProfileUpdate(BaseModel):
+    """Updated memory profiles based on user's feedback, one field per profile."""
+    chain_of_thought: str = Field(description="Reasoning about which user preferences need to add/update in each profile if required")
+    triage_preferences: Optional[str] = Field(default=None, description="Updated triage preferences, or null if this profile was not provided")
+    response_preferences: Optional[str] = Field(default=None, description="Updated response preferences, or null if this profile was not provided")
+    cal_preferences: Optional[str] = Field(default=None, description="Updated calendar preferences, or null if this profile was not provided")
\ No newline at end of file
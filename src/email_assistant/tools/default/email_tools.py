@@ -14,9 +14,9 @@ def triage_email(category: Literal["ignore", "notify", "respond"]) -> str:
     return f"Classification Decision: {category}"
 
 @tool
-class Done(BaseModel):
+def Done() -> str:
     """E-mail has been sent."""
-    done: bool
+    return "done"
 
 @tool
 class Question(BaseModel):
@@ -1,5 +1,11 @@
+import json
+from functools import lru_cache
+from operator import itemgetter
 from typing import List, Tuple, Any
 
+# Complete email inputs take the itemgetter path; partial ones fall back to .get
+_EMAIL_FIELDS = itemgetter("author", "to", "subject", "email_thread")
+
 def parse_email(email_input: dict) -> Tuple[str, str, str, str]:
     """Parse email input dictionary into components.
     
@@ -9,13 +15,17 @@ def parse_email(email_input: dict) -> Tuple[str, str, str, str]:
     Returns:
         Tuple of (author, to, subject, email_thread)
     """
-    return (
-        email_input.get("author", ""),
-        email_input.get("to", ""),
-        email_input.get("subject", ""),
-        email_input.get("email_thread", "")
-    )
+    try:
+        return _EMAIL_FIELDS(email_input)
+    except KeyError:
+        return (
+            email_input.get("author", ""),
+            email_input.get("to", ""),
+            email_input.get("subject", ""),
+            email_input.get("email_thread", "")
+        )
 
+@lru_cache(maxsize=1024)
 def format_email_markdown(subject: str, author: str, to: str, email_thread: str) -> str:
     """Format email details into a markdown string for display.
     
@@ -50,12 +60,13 @@ def extract_tool_calls(messages: List[Any]) -> List[str]:
     tool_calls = []
     
     for message in messages:
-        if hasattr(message, 'tool_calls') and message.tool_calls:
-            for tc in message.tool_calls:
-                tool_calls.append(tc['name'].lower())
+        if getattr(message, 'tool_calls', None):
+            tool_calls.extend(tc['name'].lower() for tc in message.tool_calls)
     
     return tool_calls
 
+_tool_call_fields = itemgetter("name", "args")
+
 def format_messages_string(messages: List[Any]) -> str:
     """Format a list of messages into a readable string.
     
@@ -71,11 +82,11 @@ def format_messages_string(messages: List[Any]) -> str:
         role = getattr(message, 'role', 'unknown')
         content = getattr(message, 'content', str(message))
         
-        if hasattr(message, 'tool_calls') and message.tool_calls:
-            tool_calls = [f"{tc['name']}({tc['args']})" for tc in message.tool_calls]
-            content += f" [Tools: {', '.join(tool_calls)}]"
-            
-        formatted_messages.append(f"{role.upper()}: {content}")
+        if getattr(message, 'tool_calls', None):
+            tool_calls = ", ".join(f"{name}({args})" for name, args in map(_tool_call_fields, message.tool_calls))
+            formatted_messages.append(f"{role.upper()}: {content} [Tools: {tool_calls}]")
+        else:
+            formatted_messages.append(f"{role.upper()}: {content}")
     
     return "\n\n".join(formatted_messages)
 
@@ -86,41 +97,35 @@ def format_for_display(tool_call):
     Args:
         tool_call: The tool call to format
     """
-    # Initialize empty display
-    display = ""
-    
-    # Add tool call information
-    if tool_call["name"] == "write_email":
-        display += f"""# Email Draft
+    # Build the display for the tool call in one formatting step per tool
+    name = tool_call["name"]
+    args = tool_call["args"]
+    if name == "write_email":
+        return f"""# Email Draft
 
-**To**: {tool_call["args"].get("to")}
-**Subject**: {tool_call["args"].get("subject")}
+**To**: {args.get("to")}
+**Subject**: {args.get("subject")}
 
-{tool_call["args"].get("content")}
+{args.get("content")}
 """
-    elif tool_call["name"] == "schedule_meeting":
-        display += f"""# Calendar Invite
+    if name == "schedule_meeting":
+        return f"""# Calendar Invite
 
-**Meeting**: {tool_call["args"].get("subject")}
-**Attendees**: {', '.join(tool_call["args"].get("attendees"))}
-**Duration**: {tool_call["args"].get("duration_minutes")} minutes
-**Day**: {tool_call["args"].get("preferred_day")}
+**Meeting**: {args.get("subject")}
+**Attendees**: {', '.join(args.get("attendees"))}
+**Duration**: {args.get("duration_minutes")} minutes
+**Day**: {args.get("preferred_day")}
 """
-    elif tool_call["name"] == "Question":
+    if name == "Question":
         # Special formatting for questions to make them clear
-        display += f"""# Question for User
+        return f"""# Question for User
 
-{tool_call["args"].get("content")}
+{args.get("content")}
 """
-    else:
-        # Generic format for other tools
-        display += f"""# Tool Call: {tool_call["name"]}
+    # Generic format for other tools; args may be a dictionary or a string
+    formatted_args = json.dumps(args, indent=2) if isinstance(args, dict) else args
+    return f"""# Tool Call: {name}
 
-Arguments:"""
-        
-        # Check if args is a dictionary or string
-        if isinstance(tool_call["args"], dict):
-            display += f"\n{json.dumps(tool_call['args'], indent=2)}\n"
-        else:
-            display += f"\n{tool_call['args']}\n"
-    return display
\ No newline at end of file
+Arguments:
+{formatted_args}
+"""
@@ -6,6 +6,7 @@ This module implements LLM-as-judge evaluation
 Provides structured evaluation of email assistant responses using GPT-4o
 with the CriteriaGrade
 """
+import asyncio
 from langchain.chat_models import init_chat_model
 from pydantic import BaseModel, Field
 from email_assistant.eval.email_dataset import email_inputs, response_criteria_list
@@ -25,39 +26,58 @@ class CriteriaGrade(BaseModel):
 criteria_eval_llm = init_chat_model("openai:gpt-4o")
 criteria_eval_structured_llm = criteria_eval_llm.with_structured_output(CriteriaGrade)
 
+# Number of agent runs / grading calls in flight at once
+EVAL_MAX_CONCURRENCY = 10
 
-def run_llm_as_judge_evaluation():
+CRITERIA_USER_PROMPT = """\n\n Response criteria: {criteria} \n\n Assistant's response: \n\n {response} \n\n Evaluate whether the assistant's response meets the criteria and provide justification for your evaluation."""
+
+
+def run_llm_as_judge_evaluation(cases=None, max_concurrency=EVAL_MAX_CONCURRENCY):
     """
     Run LLM-as-judge evaluation for evaluating
     response quality using structured LLM grading.
+
+    Args:
+        cases: List of (email_input, success_criteria) pairs; defaults to
+            the second dataset example
+        max_concurrency: Maximum number of concurrent agent runs and grading calls
+
+    Returns:
+        List of CriteriaGrade, one per case
     """
 
     print("🧠 Running LLM-as-Judge Evaluation")
     print("=" * 40)
 
-    # Use first email example
-    email_input = email_inputs[1]
-    success_criteria = response_criteria_list[1]
-    
-
-    # Invoke email assistant 
-    response = compiled_email_assistant.invoke({"email_input": email_input})
-    messages = response['messages']
-
-     # Format messages into string 
-    all_messages_str = format_messages_string(messages)
-
-     # LLM-as-judge evaluation with structured output
-    eval_result = criteria_eval_structured_llm.invoke([
-        {"role": "system", "content": RESPONSE_CRITERIA_SYSTEM_PROMPT},
-        {"role": "user", "content": f"""\n\n Response criteria: {success_criteria} \n\n Assistant's response: \n\n {all_messages_str} \n\n Evaluate whether the assistant's response meets the criteria and provide justification for your evaluation."""}
-    ])
+    # Use second email example by default
+    if cases is None:
+        cases = [(email_inputs[1], response_criteria_list[1])]
+    config = {"max_concurrency": max_concurrency}
+
+    # Invoke email assistant on every email concurrently
+    responses = asyncio.run(compiled_email_assistant.abatch(
+        [{"email_input": email_input} for email_input, _ in cases],
+        config=config,
+    ))
+
+    # LLM-as-judge evaluation with structured output, graded concurrently
+    eval_results = criteria_eval_structured_llm.batch([
+        [
+            {"role": "system", "content": RESPONSE_CRITERIA_SYSTEM_PROMPT},
+            {"role": "user", "content": CRITERIA_USER_PROMPT.format(
+                criteria=success_criteria,
+                response=format_messages_string(response["messages"]),
+            )},
+        ]
+        for (_, success_criteria), response in zip(cases, responses)
+    ], config=config)
 
     print("\n📊 Evaluation Result:")
-    print(f"Grade: {'PASS' if eval_result.grade else 'FAIL'}")
-    print(f"Justification: {eval_result.justification}")
+    for eval_result in eval_results:
+        print(f"Grade: {'PASS' if eval_result.grade else 'FAIL'}")
+        print(f"Justification: {eval_result.justification}")
     
-    return eval_result
+    return eval_results
 
 
 if __name__ == "__main__":
@@ -0,0 +1,5 @@
+import os
+
+# Chat models are built at import time and need a key; tests that call the
+# API still need a real one from the environment.
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,171 @@
+"""Tests for the response agent and its helpers."""
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+from email_assistant import agent
+from email_assistant.agent import EmailIdConflictError, aprocess_email, select_tool_subset
+from email_assistant.agent_tools import write_email
+from email_assistant.llm_cache import SemanticCache
+from email_assistant.schemas import RouterSchema
+
+WRITE_ARGS = {"to": "a@b.c", "subject": "Re", "content": "Hello"}
+
+
+def _after_tool_calls(*results):
+    calls = [{"name": name, "args": {}, "id": f"call_{i}"} for i, (name, _) in enumerate(results)]
+    return {"messages": [
+        HumanMessage("Respond to the email"),
+        AIMessage("", tool_calls=calls),
+        *(ToolMessage(content=content, tool_call_id=f"call_{i}") for i, (_, content) in enumerate(results)),
+    ]}
+
+
+def test_sent_email_switches_to_the_done_subset():
+    state = _after_tool_calls(("write_email", write_email.invoke(WRITE_ARGS)))
+
+    assert select_tool_subset(state) == "sent"
+
+
+def test_failed_write_email_keeps_the_full_tool_set():
+    state = _after_tool_calls(("write_email", "Error running write_email: Email sent to a@b.c failed"))
+
+    assert select_tool_subset(state) == "draft"
+
+
+def test_sent_email_is_found_among_sibling_tool_results():
+    state = _after_tool_calls(
+        ("write_email", write_email.invoke(WRITE_ARGS)),
+        ("check_calendar_availability", "Available times on Monday: 9:00 AM"),
+    )
+
+    assert select_tool_subset(state) == "sent"
+
+
+def test_earlier_sent_email_does_not_count_for_a_new_turn():
+    state = {"messages": [
+        *_after_tool_calls(("write_email", write_email.invoke(WRITE_ARGS)))["messages"],
+        AIMessage("Anything else?"),
+    ]}
+
+    assert select_tool_subset(state) == "draft"
+
+
+EMAIL = {
+    "author": "Alice Smith <alice.smith@company.com>",
+    "to": "Lance Martin <lance@company.com>",
+    "subject": "Quick question",
+    "email_thread": "Could we schedule a quick call this week?",
+}
+
+
+@pytest.fixture
+def fake_llms(monkeypatch):
+    """Answer every email with one drafted reply; the first reply attempt can be made to fail."""
+    calls = {"router": 0, "agent": 0, "fail_agent": 0}
+
+    def route(messages):
+        calls["router"] += 1
+        return RouterSchema(reasoning="r", classification="respond")
+
+    def reply(messages):
+        calls["agent"] += 1
+        if calls["fail_agent"]:
+            calls["fail_agent"] -= 1
+            raise RuntimeError("model unavailable")
+        if isinstance(messages[-1], ToolMessage):
+            return AIMessage("", tool_calls=[{"name": "Done", "args": {}, "id": f"call_{len(messages)}"}])
+        return AIMessage("", tool_calls=[{"name": "write_email", "args": WRITE_ARGS, "id": f"call_{len(messages)}"}])
+
+    monkeypatch.setattr(agent, "llm_router", RunnableLambda(route))
+    monkeypatch.setattr(agent, "use_llm_cache", False)
+    for subset in agent.bound_llms:
+        monkeypatch.setitem(agent.bound_llms, subset, RunnableLambda(reply))
+    agent.node_cache.clear()
+    yield calls
+    agent.node_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_retry_with_email_id_resumes_after_triage(fake_llms, request):
+    email_id = request.node.name
+    fake_llms["fail_agent"] = 1
+
+    with pytest.raises(RuntimeError):
+        await aprocess_email(EMAIL, email_id)
+    # Without the node cache only the checkpoint can spare the triage call
+    agent.node_cache.clear()
+    result = await aprocess_email(EMAIL, email_id)
+
+    assert result["response"] == "Hello"
+    assert fake_llms["router"] == 1
+
+
+@pytest.mark.asyncio
+async def test_finished_email_id_returns_the_result_without_keeping_its_thread(fake_llms, request):
+    email_id = request.node.name
+
+    first = await aprocess_email(EMAIL, email_id)
+    again = await aprocess_email(EMAIL, email_id)
+
+    assert again == first
+    assert fake_llms["router"] == 1
+    assert await agent.checkpointer.aget_tuple({"configurable": {"thread_id": email_id}}) is None
+
+
+@pytest.mark.asyncio
+async def test_email_id_reused_for_a_different_email_is_rejected(fake_llms, request):
+    email_id = request.node.name
+    fake_llms["fail_agent"] = 1
+    with pytest.raises(RuntimeError):
+        await aprocess_email(EMAIL, email_id)
+
+    with pytest.raises(EmailIdConflictError):
+        await aprocess_email({**EMAIL, "subject": "Another question"}, email_id)
+
+    await aprocess_email(EMAIL, email_id)
+    with pytest.raises(EmailIdConflictError):
+        await aprocess_email({**EMAIL, "subject": "Another question"}, email_id)
+
+
+@pytest.mark.asyncio
+async def test_sync_process_email_points_async_callers_to_aprocess_email():
+    with pytest.raises(RuntimeError, match="aprocess_email"):
+        agent.process_email(EMAIL)
+
+
+def test_sync_process_email_runs_outside_an_event_loop(fake_llms):
+    assert agent.process_email(EMAIL)["classification"] == "respond"
+
+
+class _SilentStreamLLM(RunnableLambda):
+    """Model whose stream ends without yielding a chunk."""
+
+    async def astream(self, input, config=None, **kwargs):
+        return
+        yield
+
+
+@pytest.mark.asyncio
+async def test_llm_call_falls_back_to_invoke_when_the_stream_is_empty(fake_llms, monkeypatch):
+    silent = _SilentStreamLLM(agent.bound_llms["draft"].func)
+    monkeypatch.setitem(agent.bound_llms, "draft", silent)
+
+    command = await agent.llm_call({"messages": [HumanMessage("Respond to the email")]})
+
+    assert command.update["messages"][0].tool_calls[0]["name"] == "write_email"
+    assert command.goto == "tool_handler"
+
+
+@pytest.mark.asyncio
+async def test_semantic_triage_cache_is_not_shared_between_senders(fake_llms, monkeypatch):
+    monkeypatch.setattr(agent, "triage_semantic_cache", SemanticCache(DeterministicFakeEmbedding(size=16)))
+    email = (EMAIL["to"], EMAIL["subject"], EMAIL["email_thread"])
+
+    await agent.classify_email("Alice <alice@company.com>", *email)
+    await agent.classify_email("ALICE <alice@company.com>", *email)
+    await agent.classify_email("Mallory <mallory@example.com>", *email)
+
+    assert fake_llms["router"] == 2
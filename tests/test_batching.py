@@ -0,0 +1,63 @@
+"""Tests for the MicroBatcher used to batch concurrent triage calls."""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from email_assistant.batching import MicroBatcher
+
+
+def _submit_all(batcher, items):
+    with ThreadPoolExecutor(max_workers=len(items)) as pool:
+        futures = [pool.submit(batcher.submit, item) for item in items]
+        return [f.exception(timeout=5) or f.result() for f in futures]
+
+
+def test_results_go_back_to_their_callers_in_batches():
+    batches = []
+
+    def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=4, max_wait=0.5)
+
+    assert _submit_all(batcher, [1, 2, 3, 4]) == [2, 4, 6, 8]
+    assert sorted(len(batch) for batch in batches) == [4]
+
+
+def test_partial_batch_runs_after_max_wait():
+    batcher = MicroBatcher(lambda items: [item.upper() for item in items], max_batch_size=10, max_wait=0.05)
+
+    started = time.monotonic()
+    assert batcher.submit("a") == "A"
+    assert time.monotonic() - started < 2
+
+
+def test_failing_batch_raises_in_every_caller():
+    def fail(items):
+        raise RuntimeError("llm down")
+
+    batcher = MicroBatcher(fail, max_batch_size=3, max_wait=0.5)
+
+    errors = _submit_all(batcher, ["a", "b", "c"])
+    assert all(isinstance(e, RuntimeError) and str(e) == "llm down" for e in errors)
+
+
+def test_short_result_list_fails_every_caller_instead_of_hanging():
+    batcher = MicroBatcher(lambda items: items[:1], max_batch_size=3, max_wait=0.5)
+
+    errors = _submit_all(batcher, ["a", "b", "c"])
+    assert all(isinstance(e, ValueError) for e in errors)
+
+
+def test_submit_refuses_to_block_an_event_loop():
+    batcher = MicroBatcher(lambda items: items)
+
+    async def call():
+        batcher.submit("a")
+
+    with pytest.raises(RuntimeError, match="event loop"):
+        asyncio.run(call())
@@ -0,0 +1,66 @@
+"""Tests for the shared HTTP clients used by the chat models."""
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from email_assistant.clients import LoopLocalAsyncClient
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("content-length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_async_client_survives_repeated_asyncio_run(server_url):
+    """Kept-alive connections from a closed loop must not be reused by the next loop."""
+    client = LoopLocalAsyncClient()
+    for _ in range(3):
+        response = asyncio.run(client.get(server_url))
+        assert response.text == "ok"
+
+
+def test_loop_client_is_closed_when_its_loop_shuts_down(server_url):
+    client = LoopLocalAsyncClient()
+
+    async def request():
+        await client.get(server_url)
+        return client._loop_clients[asyncio.get_running_loop()][0]
+
+    loop_client = asyncio.run(request())
+
+    assert loop_client.is_closed
+
+
+def test_aclose_closes_the_running_loops_client(server_url):
+    client = LoopLocalAsyncClient()
+
+    async def request_then_close():
+        await client.get(server_url)
+        loop_client = client._loop_clients[asyncio.get_running_loop()][0]
+        await client.aclose()
+        return loop_client
+
+    loop_client = asyncio.run(request_then_close())
+
+    assert loop_client.is_closed
+    assert client.is_closed
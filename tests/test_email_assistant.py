@@ -13,10 +13,11 @@ from email_assistant.eval.email_dataset import email_inputs, expected_tool_calls
 from langsmith import testing as t
 
 @pytest.mark.langsmith
+@pytest.mark.asyncio
 @pytest.mark.parametrize("email_input, expected_calls", [
     (email_inputs[i], expected_tool_calls[i]) for i in range(len(email_inputs))
 ])
-def test_email_dataset_tool_calls(email_input, expected_calls):
+async def test_email_dataset_tool_calls(email_input, expected_calls):
     """Test if email processing contains expected tool calls.
     
     This test confirms that all expected tools are called during email processing,
@@ -25,7 +26,7 @@ def test_email_dataset_tool_calls(email_input, expected_calls):
     """
 
     # Run the email assistant
-    result = compiled_email_assistant.invoke({"email_input": email_input})
+    result = await compiled_email_assistant.ainvoke({"email_input": email_input})
 
     # Extract tool calls from messages list
     extracted_tool_calls = extract_tool_calls(result['messages'])
@@ -0,0 +1,32 @@
+"""Tests for the rule-based triage pre-classifier."""
+
+import pytest
+
+from email_assistant.eval.email_dataset import email_input_9, examples_triage
+from email_assistant.fast_triage import fast_triage
+
+
+@pytest.mark.parametrize("example", examples_triage)
+def test_never_contradicts_the_dataset_label(example):
+    email = example["inputs"]["email_input"]
+
+    decision = fast_triage(email["author"], email["subject"], email["email_thread"])
+
+    assert decision is None or decision[0] == example["outputs"]["classification"]
+
+
+def test_github_notification_with_unsubscribe_footer_goes_to_the_llm():
+    thread = email_input_9["email_thread"] + "\nUnsubscribe: https://github.com/notifications/unsubscribe/abc\n"
+
+    assert fast_triage(email_input_9["author"], email_input_9["subject"], thread) is None
+
+
+@pytest.mark.parametrize("subject", ["Automatic reply: Project sync", "Out of Office: back Monday", "Auto-Reply: Re: Invoice"])
+def test_auto_replies_are_notify(subject):
+    decision = fast_triage("Bob <bob@company.com>", subject, "I'm away until Monday with limited access to email.")
+
+    assert decision is not None and decision[0] == "notify"
+
+
+def test_regular_email_goes_to_the_llm():
+    assert fast_triage("Alice <alice@company.com>", "Quick question", "Can we talk about the API?") is None
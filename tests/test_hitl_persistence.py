@@ -0,0 +1,87 @@
+"""Tests for how the HITL graph chooses and manages its persistence backend."""
+
+import asyncio
+import os
+
+import pytest
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.redis import AsyncRedisSaver
+from langgraph.store.memory import InMemoryStore
+from langgraph.store.redis import RedisStore
+
+import email_assistant.agent_hitl as agent_hitl
+
+
+@pytest.fixture
+def fresh_graph(monkeypatch):
+    monkeypatch.setattr(agent_hitl, "_COMPILED", None)
+    monkeypatch.setattr(agent_hitl, "_OPENED", None)
+    monkeypatch.setattr(agent_hitl, "checkpointer", None)
+    monkeypatch.setattr(agent_hitl, "store", None)
+
+
+def test_redis_url_alone_keeps_in_memory_persistence(monkeypatch, fresh_graph):
+    monkeypatch.setenv("REDIS_URL", "redis://localhost:1")
+    monkeypatch.delenv("HITL_PERSISTENCE", raising=False)
+
+    async def opened():
+        async with agent_hitl.open_email_assistant_hitl() as compiled:
+            return compiled, await agent_hitl.aget_compiled_email_assistant_hitl()
+
+    compiled, current = asyncio.run(opened())
+
+    assert current is compiled
+    assert isinstance(compiled.checkpointer, InMemorySaver)
+    assert isinstance(compiled.store, InMemoryStore)
+
+
+def test_sync_graph_stays_in_memory_with_redis_enabled(monkeypatch, fresh_graph):
+    monkeypatch.setenv("HITL_PERSISTENCE", "redis")
+    monkeypatch.setenv("REDIS_URL", "redis://localhost:1")
+
+    compiled = agent_hitl.compiled_email_assistant_hitl
+
+    assert isinstance(compiled.checkpointer, InMemorySaver)
+
+
+def test_redis_persistence_requires_redis_url(monkeypatch, fresh_graph):
+    monkeypatch.setenv("HITL_PERSISTENCE", "redis")
+    monkeypatch.delenv("REDIS_URL", raising=False)
+
+    async def opened():
+        async with agent_hitl.open_email_assistant_hitl():
+            pass
+
+    with pytest.raises(RuntimeError, match="REDIS_URL"):
+        asyncio.run(opened())
+
+
+def test_redis_graph_is_unavailable_outside_the_app_lifespan(monkeypatch, fresh_graph):
+    monkeypatch.setenv("HITL_PERSISTENCE", "redis")
+
+    with pytest.raises(RuntimeError, match="open_email_assistant_hitl"):
+        asyncio.run(agent_hitl.aget_compiled_email_assistant_hitl())
+
+
+@pytest.mark.skipif(not os.getenv("TEST_REDIS_URL"), reason="needs a Redis Stack server at TEST_REDIS_URL")
+def test_redis_persistence_round_trip(monkeypatch, fresh_graph):
+    monkeypatch.setenv("HITL_PERSISTENCE", "redis")
+    monkeypatch.setenv("REDIS_URL", os.environ["TEST_REDIS_URL"])
+
+    async def opened():
+        async with agent_hitl.open_email_assistant_hitl() as compiled:
+            assert await agent_hitl.aget_compiled_email_assistant_hitl() is compiled
+            assert isinstance(compiled.checkpointer, AsyncRedisSaver)
+            assert isinstance(compiled.store, RedisStore)
+
+            namespace = ("email_assistant", "test_persistence")
+            await asyncio.to_thread(compiled.store.put, namespace, "user_preferences", "prefers mornings")
+            item = await asyncio.to_thread(compiled.store.get, namespace, "user_preferences")
+            assert item.value == "prefers mornings"
+
+            state = await compiled.aget_state({"configurable": {"thread_id": "test-persistence-missing"}})
+            assert not state.values
+
+    asyncio.run(opened())
+    with pytest.raises(RuntimeError):
+        asyncio.run(agent_hitl.aget_compiled_email_assistant_hitl())
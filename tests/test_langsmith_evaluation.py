@@ -1,11 +1,12 @@
+import asyncio
 from email_assistant.agent import compiled_email_assistant
 from email_assistant.eval.email_dataset import examples_triage
 from langsmith import Client
 import os
 
-def target_email_assistant(inputs: dict):
+async def target_email_assistant(inputs: dict):
     """Process an email through the workflow-based email assistant."""
-    response = compiled_email_assistant.nodes['triage_router'].invoke({"email_input": inputs["email_input"]})
+    response = await compiled_email_assistant.nodes['triage_router'].ainvoke({"email_input": inputs["email_input"]})
     return {"classification_decision": response.update['classification_decision']}
 
 def classification_evaluator(outputs: dict, reference_outputs: dict) -> bool:
@@ -33,7 +34,7 @@ def create_evaluation_dataset():
     return dataset_name
 
 
-def run_langsmith_evaluation():
+async def run_langsmith_evaluation():
     " Run evaluation using LangSm ith Dataset"
 
     client = Client()
@@ -42,7 +43,7 @@ def run_langsmith_evaluation():
     print(f"🔍 Running evaluation against dataset: {dataset_name}")
     
     # Run evaluation 
-    experiment_results = client.evaluate(
+    experiment_results = await client.aevaluate(
         # Run agent 
         target_email_assistant,
         # Evaluator
@@ -54,13 +55,14 @@ def run_langsmith_evaluation():
         # Number of concurrent evaluations
         max_concurrency=10, 
     )
+    return experiment_results
 
 if __name__ == "__main__":
     print("🚀 LangSmith Evaluation Demo")
     print("=" * 40)
     
     if os.getenv("LANGSMITH_API_KEY"):
-        result = run_langsmith_evaluation()
+        result = asyncio.run(run_langsmith_evaluation())
         if result:
             print(f"View results at: https://smith.langchain.com/")
     else:
@@ -0,0 +1,110 @@
+"""Tests for the LLM response caches."""
+
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from email_assistant import llm_cache
+from email_assistant.llm_cache import LLMCache, LRUCache, SemanticCache, cache_key
+
+MESSAGES = [{"role": "system", "content": "Triage emails"}, {"role": "user", "content": "Hello"}]
+
+
+def test_cache_key_is_stable_for_equal_requests():
+    assert cache_key("openai:gpt-4.1", MESSAGES, 0.0) == cache_key("openai:gpt-4.1", list(MESSAGES), 0.0)
+
+
+def test_cache_key_ignores_message_ids_and_tool_order():
+    first = [SystemMessage("Triage emails", id="a"), HumanMessage("Hello", id="b")]
+    second = [SystemMessage("Triage emails", id="c"), HumanMessage("Hello", id="d")]
+
+    assert cache_key("m", first, 0.0, tools=["b", "a"]) == cache_key("m", second, 0.0, tools=["a", "b"])
+    assert cache_key("m", first, 0.0) == cache_key("m", MESSAGES, 0.0)
+
+
+@pytest.mark.parametrize("change", [
+    {"model": "openai:gpt-4o"},
+    {"messages": MESSAGES + [AIMessage("Hi")]},
+    {"temperature": 0.5},
+    {"tools": ["write_email"]},
+    {"response_format": "RouterSchema"},
+])
+def test_cache_key_changes_with_any_request_field(change):
+    request = {"model": "openai:gpt-4.1", "messages": MESSAGES, "temperature": 0.0}
+
+    assert cache_key(**{**request, **change}) != cache_key(**request)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_expires_entries_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(llm_cache.time, "monotonic", lambda: now[0])
+    cache = LRUCache(ttl=10)
+    cache.set("a", 1)
+
+    now[0] += 9.9
+    assert cache.get("a") == 1
+    now[0] += 0.1
+    assert cache.get("a", "expired") == "expired"
+
+
+def test_llm_cache_without_redis_is_memory_only():
+    cache = LLMCache()
+    cache.set("key", {"classification": "ignore"})
+
+    assert cache.get("key") == {"classification": "ignore"}
+    assert cache.get("other") is None
+
+
+def test_unreachable_redis_is_treated_as_a_miss():
+    cache = LLMCache(redis_url="redis://127.0.0.1:1/0")
+
+    assert cache.get("key") is None
+    cache.set("key", {"classification": "ignore"})
+    assert cache.get("key") == {"classification": "ignore"}
+
+
+def test_unreachable_redis_is_treated_as_a_miss_async():
+    cache = LLMCache(redis_url="redis://127.0.0.1:1/0")
+
+    async def round_trip():
+        missing = await cache.aget("key")
+        await cache.aset("key", {"classification": "notify"})
+        return missing, await cache.aget("key")
+
+    assert asyncio.run(round_trip()) == (None, {"classification": "notify"})
+
+
+def test_semantic_cache_matches_near_duplicates_only_within_a_partition():
+    cache = SemanticCache(DeterministicFakeEmbedding(size=8), threshold=0.9)
+    stored = np.array([1.0, 0.0], dtype=np.float32)
+    near = np.array([0.99, 0.14], dtype=np.float32)
+    cache.put(stored, "notify", "boss@company.com")
+
+    assert cache.lookup(near / np.linalg.norm(near), "boss@company.com") == "notify"
+    assert cache.lookup(near / np.linalg.norm(near), "stranger@example.com") is None
+    assert cache.lookup(np.array([0.0, 1.0], dtype=np.float32), "boss@company.com") is None
+
+
+def test_semantic_cache_evicts_the_oldest_entry_with_its_partition():
+    cache = SemanticCache(DeterministicFakeEmbedding(size=8), maxsize=1)
+    vector = np.array([1.0, 0.0], dtype=np.float32)
+    cache.put(vector, "notify", "boss@company.com")
+    cache.put(vector, "ignore", "stranger@example.com")
+
+    assert cache.lookup(vector, "boss@company.com") is None
+    assert cache.lookup(vector, "stranger@example.com") == "ignore"
@@ -0,0 +1,242 @@
+"""Tests for the FastAPI endpoints and their helpers."""
+
+import asyncio
+import re
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+from email_assistant import agent, agent_hitl
+from email_assistant.main import _extract_final_result, app
+from email_assistant.schemas import MAX_BATCH_EMAILS, RouterSchema, UserPreferences
+from email_assistant.tools.default.calendar_tools import schedule_meeting
+from email_assistant.tools.default.email_tools import write_email
+
+
+def _tool_result(tool, args):
+    return ToolMessage(content=tool.invoke(args), tool_call_id="call_1")
+
+
+def test_extract_final_result_reports_sent_email():
+    sent = _tool_result(write_email, {"to": "a@b.c", "subject": "Re", "content": "Hello"})
+    state = {
+        "classification_decision": "respond",
+        "messages": [HumanMessage("Hi"), AIMessage("Sending"), sent, AIMessage("Done")],
+    }
+
+    result = _extract_final_result(state)
+
+    assert result.classification == "respond"
+    assert result.response == sent.content
+
+
+def test_extract_final_result_reports_scheduled_meeting():
+    scheduled = _tool_result(schedule_meeting, {
+        "attendees": ["a@b.c"],
+        "subject": "Sync",
+        "duration_minutes": 30,
+        "preferred_day": "2025-05-22",
+        "start_time": 14,
+    })
+
+    result = _extract_final_result({"classification_decision": "respond", "messages": [scheduled]})
+
+    assert result.response == scheduled.content
+
+
+def test_extract_final_result_ignores_other_tool_results():
+    other = ToolMessage(content="Available times on Monday: 9:00 AM", tool_call_id="call_1")
+
+    result = _extract_final_result({"messages": [other]})
+
+    assert result.response == "No response generated"
+
+
+def test_extract_final_result_finds_marker_after_a_prefix():
+    # agent_tools.write_email prefixes its result with an emoji
+    sent = ToolMessage(content="✉️ Email sent to a@b.c with subject 'Re'", tool_call_id="call_1")
+
+    result = _extract_final_result({"messages": [sent]})
+
+    assert result.response == sent.content
+
+
+EMAIL = {
+    "author": "Alice Smith <alice.smith@company.com>",
+    "to": "Lance Martin <lance@company.com>",
+    "subject": "Quick question",
+    "email_thread": "Could we schedule a quick call this week?",
+}
+
+
+@pytest.mark.parametrize("body", [
+    {},
+    {"thread_id": "abc"},
+    {"human_response": {"type": "accept"}},
+    {"email": EMAIL, "thread_id": "abc"},
+])
+def test_hitl_rejects_requests_that_are_neither_new_nor_resume(body):
+    response = TestClient(app).post("/process-email-hitl", json=body)
+
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def fake_router(monkeypatch):
+    """Route each email by the ``classify-as-<label>`` marker in its thread.
+
+    Earlier emails answer later, so results only come back in request order if
+    the endpoint restores it.
+    """
+    async def route(messages):
+        match = re.search(r"classify-as-(\w+) #(\d+)", messages[-1]["content"])
+        label, index = match.group(1), int(match.group(2))
+        await asyncio.sleep(0.01 * (10 - index))
+        return RouterSchema(reasoning="r", classification=label)
+
+    monkeypatch.setattr(agent, "llm_router", RunnableLambda(route))
+    monkeypatch.setattr(agent, "use_llm_cache", False)
+
+
+def test_batch_returns_results_in_request_order(fake_router):
+    labels = ["ignore", "ignore", "ignore", "notify", "notify", "notify"]
+    emails = [
+        {**EMAIL, "email_thread": f"classify-as-{label} #{index}"}
+        for index, label in enumerate(labels)
+    ]
+
+    response = TestClient(app).post("/process-email/batch", json={"emails": emails})
+
+    assert response.status_code == 200
+    results = [item["result"] for item in response.json()["results"]]
+    assert [result["classification"] for result in results] == labels
+
+
+def test_process_email_rejects_an_email_id_reused_for_another_email(fake_router):
+    client = TestClient(app)
+    first = {**EMAIL, "email_thread": "classify-as-ignore #0"}
+    second = {**EMAIL, "email_thread": "classify-as-notify #1"}
+
+    assert client.post("/process-email", json={"email": first, "email_id": "reused-id"}).status_code == 200
+    response = client.post("/process-email", json={"email": second, "email_id": "reused-id"})
+
+    assert response.status_code == 409
+
+
+def test_batch_rejects_more_than_max_emails():
+    emails = [EMAIL] * (MAX_BATCH_EMAILS + 1)
+
+    response = TestClient(app).post("/process-email/batch", json={"emails": emails})
+
+    assert response.status_code == 422
+
+
+def _fake_agent_llm(messages):
+    """Draft an email until one has been sent, then finish."""
+    last = messages[-1]
+    if isinstance(last, ToolMessage) and last.content.startswith("Email sent"):
+        return AIMessage("", tool_calls=[{"name": "Done", "args": {}, "id": f"call_{len(messages)}"}])
+    return AIMessage("", tool_calls=[{
+        "name": "write_email",
+        "args": {"to": "alice.smith@company.com", "subject": "Re: Quick question", "content": "Sure."},
+        "id": f"call_{len(messages)}",
+    }])
+
+
+@pytest.fixture
+def hitl_llms(monkeypatch):
+    """Replace the HITL assistant's LLMs so every email is answered with a drafted reply."""
+    agent_llm = RunnableLambda(_fake_agent_llm)
+    monkeypatch.setattr(agent_hitl, "llm_router", RunnableLambda(
+        lambda messages: RouterSchema(reasoning="r", classification="respond")
+    ))
+    monkeypatch.setattr(agent_hitl, "_LLM_FULL", agent_llm)
+    monkeypatch.setattr(agent_hitl, "_LLM_AFTER_SEND", agent_llm)
+    monkeypatch.setattr(agent_hitl, "llm_memory", RunnableLambda(
+        lambda messages: UserPreferences(chain_of_thought="", user_preferences="updated")
+    ))
+
+
+def test_thread_state_is_not_modified_until_the_thread_moves_on(hitl_llms):
+    client = TestClient(app)
+    thread_id = client.post("/process-email-hitl", json={"email": EMAIL}).json()["thread_id"]
+
+    first = client.get(f"/process-email-hitl/{thread_id}")
+    etag = first.headers["ETag"]
+    unchanged = client.get(f"/process-email-hitl/{thread_id}", headers={"If-None-Match": etag})
+
+    assert first.status_code == 200
+    assert first.json()["status"] == "interrupted"
+    assert unchanged.status_code == 304
+    assert unchanged.headers["ETag"] == etag
+
+    resumed = client.post("/process-email-hitl", json={
+        "thread_id": thread_id, "human_response": {"type": "accept"},
+    })
+    changed = client.get(f"/process-email-hitl/{thread_id}", headers={"If-None-Match": etag})
+
+    assert resumed.json()["status"] == "completed"
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["status"] == "completed"
+
+
+def test_hitl_stream_reports_progress_then_the_interrupt(hitl_llms):
+    response = TestClient(app).post("/process-email-hitl?stream=true", json={"email": EMAIL})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [orjson.loads(line) for line in response.text.splitlines()]
+    thread_id = lines[0]["thread_id"]
+    assert lines[0] == {"event": "started", "thread_id": thread_id}
+    assert lines[1] == {"event": "update", "thread_id": thread_id, "nodes": ["triage_router"]}
+    assert lines[-1]["status"] == "interrupted"
+    assert lines[-1]["thread_id"] == thread_id
+    assert lines[-1]["interrupt"]["action"] == "write_email"
+
+
+def test_hitl_stream_reports_errors_in_the_last_line(hitl_llms, monkeypatch):
+    def fail(messages):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(agent_hitl, "llm_router", RunnableLambda(fail))
+
+    response = TestClient(app).post("/process-email-hitl?stream=true", json={"email": EMAIL})
+
+    lines = [orjson.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["event"] == "started"
+    assert lines[-1]["status"] == "error"
+    assert "model unavailable" in lines[-1]["error"]
+
+
+def test_hitl_rejects_a_resume_of_an_answered_interrupt(hitl_llms):
+    client = TestClient(app)
+    first = client.post("/process-email-hitl", json={"email": EMAIL}).json()
+    thread_id, first_id = first["thread_id"], first["interrupt"]["id"]
+
+    # Feedback makes the assistant draft again, which raises a new interrupt
+    second = client.post("/process-email-hitl", json={
+        "thread_id": thread_id,
+        "interrupt_id": first_id,
+        "human_response": {"type": "response", "args": "Make it longer"},
+    }).json()
+    duplicate = client.post("/process-email-hitl", json={
+        "thread_id": thread_id,
+        "interrupt_id": first_id,
+        "human_response": {"type": "response", "args": "Make it longer"},
+    })
+
+    assert second["status"] == "interrupted"
+    assert second["interrupt"]["id"] != first_id
+    assert duplicate.status_code == 409
+
+    accepted = client.post("/process-email-hitl", json={
+        "thread_id": thread_id,
+        "interrupt_id": second["interrupt"]["id"],
+        "human_response": {"type": "accept"},
+    })
+
+    assert accepted.json()["status"] == "completed"
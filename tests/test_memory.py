@@ -0,0 +1,120 @@
+"""Tests for reading and updating the HITL assistant's memory profiles."""
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+from langgraph.store.memory import InMemoryStore
+
+import email_assistant.agent_hitl as agent_hitl
+from email_assistant.schemas import MultiProfileUpdate, UserPreferences, merge_memory_updates
+
+TRIAGE = ("email_assistant", "triage_preferences")
+RESPONSE = ("email_assistant", "response_preferences")
+
+
+@pytest.fixture
+def memory_llms(monkeypatch):
+    """Replace the memory LLMs with fakes that write fixed profiles."""
+    monkeypatch.setattr(agent_hitl, "llm_memory", RunnableLambda(
+        lambda messages: UserPreferences(chain_of_thought="", user_preferences="updated")
+    ))
+    monkeypatch.setattr(agent_hitl, "llm_memory_multi", RunnableLambda(
+        lambda messages: MultiProfileUpdate(
+            chain_of_thought="", triage_preferences="triage updated", response_preferences="response updated"
+        )
+    ))
+
+
+def test_cached_profiles_are_not_shared_between_stores():
+    first, second = InMemoryStore(), InMemoryStore()
+    first.put(TRIAGE, "user_preferences", "first profile")
+    second.put(TRIAGE, "user_preferences", "second profile")
+
+    assert agent_hitl.get_memory(first, TRIAGE, "default") == "first profile"
+    assert agent_hitl.get_memory(second, TRIAGE, "default") == "second profile"
+    assert agent_hitl.get_memories_bulk(second, [(TRIAGE, "default")]) == ["second profile"]
+
+
+def test_missing_profile_is_initialized_with_default():
+    store = InMemoryStore()
+
+    assert agent_hitl.get_memory(store, TRIAGE, "default") == "default"
+    assert store.get(TRIAGE, "user_preferences").value == "default"
+
+
+def test_update_memory_is_visible_to_the_next_read(memory_llms):
+    store = InMemoryStore()
+    assert agent_hitl.get_memory(store, TRIAGE, "default") == "default"
+
+    agent_hitl.update_memory(store, TRIAGE, [{"role": "user", "content": "feedback"}])
+
+    assert agent_hitl.get_memory(store, TRIAGE, "default") == "updated"
+
+
+def test_update_memories_is_visible_to_the_next_read(memory_llms):
+    store = InMemoryStore()
+    assert agent_hitl.get_memories_bulk(store, [(TRIAGE, "t"), (RESPONSE, "r")]) == ["t", "r"]
+
+    agent_hitl.update_memories(store, [
+        agent_hitl.memory_update(TRIAGE, [{"role": "user", "content": "feedback"}]),
+        agent_hitl.memory_update(RESPONSE, [{"role": "user", "content": "feedback"}]),
+    ])
+
+    assert agent_hitl.get_memories_bulk(store, [(TRIAGE, "t"), (RESPONSE, "r")]) == [
+        "triage updated",
+        "response updated",
+    ]
+
+
+def _wait_for_memory_worker():
+    # The memory worker runs one job at a time, so this returns after all queued ones
+    agent_hitl._MEM_EXECUTOR.submit(lambda: None).result(timeout=5)
+
+
+def test_merge_memory_updates_appends_and_replaces_by_id():
+    first = {"id": "1", "namespace": TRIAGE, "messages": ["a"]}
+    second = {"id": "2", "namespace": RESPONSE, "messages": ["b"]}
+    first_again = {"id": "1", "namespace": TRIAGE, "messages": ["c"]}
+
+    assert merge_memory_updates(None, [first]) == [first]
+    assert merge_memory_updates([first], [second]) == [first, second]
+    assert merge_memory_updates([first, second], [first_again]) == [first_again, second]
+
+
+def test_merge_memory_updates_clears_on_none():
+    update = {"id": "1", "namespace": TRIAGE, "messages": ["a"]}
+
+    assert merge_memory_updates([update], None) == []
+    assert merge_memory_updates(None, None) == []
+
+
+def test_flush_memory_clears_the_queue_and_writes_one_profile(memory_llms):
+    store = InMemoryStore()
+    updates = [agent_hitl.memory_update(TRIAGE, [{"role": "user", "content": "feedback"}])]
+
+    assert agent_hitl.flush_memory({"pending_memory_updates": updates}, store) == {"pending_memory_updates": None}
+    _wait_for_memory_worker()
+
+    assert store.get(TRIAGE, "user_preferences").value == "updated"
+
+
+def test_flush_memory_writes_several_profiles_in_one_update(memory_llms):
+    store = InMemoryStore()
+    updates = [
+        agent_hitl.memory_update(TRIAGE, [{"role": "user", "content": "feedback"}]),
+        agent_hitl.memory_update(RESPONSE, [{"role": "user", "content": "feedback"}]),
+    ]
+
+    agent_hitl.flush_memory({"pending_memory_updates": updates}, store)
+    _wait_for_memory_worker()
+
+    assert store.get(TRIAGE, "user_preferences").value == "triage updated"
+    assert store.get(RESPONSE, "user_preferences").value == "response updated"
+
+
+def test_flush_memory_without_updates_writes_nothing():
+    store = InMemoryStore()
+
+    assert agent_hitl.flush_memory({"pending_memory_updates": []}, store) == {}
+    _wait_for_memory_worker()
+
+    assert store.search(("email_assistant",)) == []